@@ -0,0 +1,222 @@
+"""
+Badge backfill job
+Awards badges to existing users from their current statistics, e.g. after
+a new badge was added to BADGE_DEFINITIONS
+
+Usage:
+  python backfill_badges.py                 - Evaluate and award badges
+  python backfill_badges.py --dry-run       - Only report what would be awarded
+  python backfill_badges.py --workers 4     - Number of worker processes (0 = in-process)
+  python backfill_badges.py --notify        - Tell users about new badges (throttled)
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from handlers.badges import (
+    BADGE_BITS,
+    BADGE_CHECKS,
+    BADGE_DEFINITIONS,
+    ensure_badge_storage,
+    load_legacy_awards
+)
+from settings import DB_PATH
+from utils import badge_store
+from utils.badge_rules import build_badge_context
+
+# (user_id, badge context, earned mask)
+Job = Tuple[int, Dict, int]
+
+# Chunks submitted per worker ahead of the results being handled; bounds
+# how many users are held in memory at once
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+
+def evaluate_chunk(chunk: List[Job]) -> List[Tuple[int, int, List[str]]]:
+    """
+    Evaluate compiled badge rules for a chunk of users (runs in worker process)
+
+    Returns:
+        List of (user_id, new bits, newly earned badge IDs)
+    """
+    results = []
+    for user_id, context, mask in chunk:
+        new_bits = 0
+        new_ids = []
+        for badge_id, check in BADGE_CHECKS.items():
+            bit = BADGE_BITS[badge_id]
+            if mask & bit:
+                continue
+            try:
+                if check(context):
+                    new_bits |= bit
+                    new_ids.append(badge_id)
+            except Exception as e:
+                print(f"Error checking badge {badge_id} for {user_id}: {e}")
+        if new_bits:
+            results.append((user_id, new_bits, new_ids))
+    return results
+
+
+def load_masks(dry_run: bool = False) -> Dict[int, int]:
+    """
+    Earned badge bitmask of every user
+
+    A dry run neither migrates the database nor imports user_badges.json:
+    the database is opened read-only, and while it has no badges stored
+    the masks the import would store are computed from the JSON file.
+    """
+    if not dry_run:
+        ensure_badge_storage()
+        return dict(badge_store.iter_badge_masks())
+
+    masks = {}
+    try:
+        conn = sqlite3.connect(f'file:{DB_PATH}?mode=ro', uri=True)
+        try:
+            masks = dict(conn.execute("SELECT user_id, badge_mask FROM user_badges"))
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Stored badges not readable ({e}), using user_badges.json")
+
+    if not masks:
+        masks = {user_id: bits for user_id, (bits, _) in load_legacy_awards().items()}
+    return masks
+
+
+def iter_chunks(chunk_size: int, dry_run: bool = False):
+    """Stream user badge contexts in chunks"""
+    from user_stats import load_stats
+    from handlers.leaderboard import get_leaderboard, LEADERBOARD_EXACT_TOP_K
+
+    masks = load_masks(dry_run)
+
+    # Exact ranks are only known for the top of the board - enough for 'legend'
+    ranks = {
+        entry['user_id']: rank
+        for rank, entry in enumerate(get_leaderboard('alltime', limit=LEADERBOARD_EXACT_TOP_K), 1)
+    }
+
+    chunk = []
+    for user_key, user_stats in load_stats().items():
+        user_id = int(user_key)
+        context = build_badge_context(dict(user_stats, top_rank=ranks.get(user_id, 999)))
+        chunk.append((user_id, context, masks.get(user_id, 0)))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def send_notifications(pending: Dict[int, List[str]], rate: float) -> None:
+    """Send one message per user listing their new badges, at most `rate` per second"""
+    from telegram import Bot
+    import config
+
+    bot = Bot(token=config.TOKEN)
+    interval = 1.0 / rate if rate > 0 else 0
+    sent = 0
+    failed = 0
+
+    async with bot:
+        for user_id, badge_ids in pending.items():
+            lines = "\n".join(
+                f"{BADGE_DEFINITIONS[b]['emoji']} <b>{BADGE_DEFINITIONS[b]['name']}</b>"
+                for b in badge_ids
+            )
+            try:
+                await bot.send_message(
+                    chat_id=user_id,
+                    text=f"🎉 <b>YANGI NISHONLAR!</b> 🎉\n\n{lines}\n\nTabriklaymiz! 🚀",
+                    parse_mode='HTML'
+                )
+                sent += 1
+            except Exception as e:
+                failed += 1
+                print(f"Failed to notify {user_id}: {e}")
+            await asyncio.sleep(interval)
+
+    print(f"📨 Notifications: {sent} sent, {failed} failed")
+
+
+def run_backfill(dry_run: bool = False, workers: int = 0, chunk_size: int = 500) -> Dict[int, List[str]]:
+    """
+    Evaluate all users and write newly earned badges in bulk
+
+    Returns:
+        user_id -> newly earned badge IDs
+    """
+    print("\n" + "=" * 60)
+    print(f"Badge backfill{' (DRY RUN)' if dry_run else ''}")
+    print("=" * 60)
+
+    started = time.perf_counter()
+    users = 0
+    awarded: Dict[int, List[str]] = {}
+    earned_at = datetime.now().isoformat()
+
+    def handle(chunk_size_done: int, results) -> None:
+        nonlocal users
+        users += chunk_size_done
+        awards = {}
+        for user_id, bits, badge_ids in results:
+            awarded[user_id] = badge_ids
+            awards[user_id] = (bits, {badge_id: earned_at for badge_id in badge_ids})
+        if awards and not dry_run:
+            badge_store.award_badges(awards)
+        elapsed = time.perf_counter() - started
+        print(f"   {users} users, {len(awarded)} with new badges ({users / elapsed:.0f} users/s)")
+
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()  # (chunk length, future), oldest first
+            for chunk in iter_chunks(chunk_size, dry_run):
+                in_flight.append((len(chunk), pool.submit(evaluate_chunk, chunk)))
+                if len(in_flight) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                    size, future = in_flight.popleft()
+                    handle(size, future.result())
+            while in_flight:
+                size, future = in_flight.popleft()
+                handle(size, future.result())
+    else:
+        for chunk in iter_chunks(chunk_size, dry_run):
+            handle(len(chunk), evaluate_chunk(chunk))
+
+    elapsed = time.perf_counter() - started
+    total_badges = sum(len(ids) for ids in awarded.values())
+    print(f"\n✅ {users} users in {elapsed:.2f}s ({users / elapsed if elapsed else 0:.0f} users/s)")
+    print(f"🏅 {total_badges} badges for {len(awarded)} users{' would be awarded' if dry_run else ' awarded'}")
+
+    by_badge: Dict[str, int] = {}
+    for badge_ids in awarded.values():
+        for badge_id in badge_ids:
+            by_badge[badge_id] = by_badge.get(badge_id, 0) + 1
+    for badge_id, count in sorted(by_badge.items(), key=lambda item: -item[1]):
+        print(f"   {BADGE_DEFINITIONS[badge_id]['emoji']} {badge_id:20s} {count}")
+
+    return awarded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Award badges to existing users")
+    parser.add_argument('--dry-run', action='store_true', help="don't write anything")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (0 = evaluate in-process)")
+    parser.add_argument('--chunk-size', type=int, default=500, help="users per worker task")
+    parser.add_argument('--notify', action='store_true', help="message users about new badges")
+    parser.add_argument('--rate', type=float, default=20, help="notifications per second")
+    args = parser.parse_args()
+
+    awarded = run_backfill(args.dry_run, args.workers, args.chunk_size)
+
+    if args.notify and awarded and not args.dry_run:
+        asyncio.run(send_notifications(awarded, args.rate))
@@ -0,0 +1,65 @@
+"""
+Certificate rendering benchmark
+Compares renders/second with a cold asset cache (templates and fonts
+loaded on every render, as before the cache) and a warm one, then shows
+encoder profile metrics.
+
+Usage:
+  python benchmarks/bench_render.py [renders]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import badge_images
+
+
+def render_badge(i: int) -> None:
+    badge_images.generate_badge_certificate(
+        badge_name='🥇 Oltin O\'quvchi',
+        badge_emoji='🥇',
+        username=f'user{i}',
+        date_earned='15.01.2025'
+    )
+
+
+def render_rank(i: int) -> None:
+    badge_images.generate_leaderboard_certificate(
+        rank=i % 10 + 1,
+        username=f'user{i}',
+        points=1234,
+        correct=456,
+        total=500,
+        accuracy=91.2,
+        tests_taken=42
+    )
+
+
+def bench(render, renders: int, cold: bool) -> float:
+    """Renders per second"""
+    badge_images.warm_asset_cache()
+    started = time.perf_counter()
+    for i in range(renders):
+        if cold:
+            badge_images.clear_asset_cache()
+        render(i)
+    return renders / (time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    renders = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+
+    print(f"{'certificate':<12} {'cold r/s':>10} {'warm r/s':>10} {'speedup':>8}")
+    for name, render in (('badge', render_badge), ('rank', render_rank)):
+        cold = bench(render, renders, cold=True)
+        warm = bench(render, renders, cold=False)
+        print(f"{name:<12} {cold:>10.1f} {warm:>10.1f} {warm / cold:>7.2f}x")
+
+    print(f"\nbyte budget: {badge_images.CERTIFICATE_BYTE_BUDGET}")
+    print(f"{'profile':<22} {'encodes':>8} {'avg ms':>8} {'avg KB':>8} {'over':>6}")
+    for profile_name, stats in badge_images.get_encoder_stats().items():
+        print(f"{profile_name:<22} {stats['count']:>8} {stats['avg_ms']:>8.1f} "
+              f"{stats['avg_bytes'] / 1024:>8.1f} {stats['over_budget']:>6}")
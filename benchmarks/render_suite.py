@@ -0,0 +1,215 @@
+"""
+Certificate renderer benchmark and golden-image regression suite
+Renders every badge and ranks 1-N with each renderer, reports latency
+percentiles, peak RSS and output size, and compares output against
+golden thumbnails.
+
+Usage:
+  python benchmarks/render_suite.py                  - Benchmark and check goldens
+  python benchmarks/render_suite.py --update-golden  - Re-record golden thumbnails
+  python benchmarks/render_suite.py --ranks 20 --renderers badge_images
+"""
+
+import argparse
+import importlib.util
+import os
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from multiprocessing import get_context
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+GOLDEN_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'golden')
+GOLDEN_SIZE = (80, 120)
+GOLDEN_RANKS = (1, 2, 3, 4, 10, 100)
+# Thumbnails are compared tile by tile so a local change isn't averaged away
+GOLDEN_TILE = 10
+# Worst tile's mean absolute pixel difference (0-255) allowed. Switching
+# encoder profiles moves it by ~1, a changed username by ~20.
+DEFAULT_TOLERANCE = 4.0
+
+USERNAME = 'golden_user'
+DATE_EARNED = '01.01.2025'
+FROZEN_NOW = datetime(2025, 1, 1, 12, 0)
+
+RENDERERS = {
+    'badge_images': os.path.join(ROOT_DIR, 'utils', 'badge_images.py'),
+    'badge_images_extra': os.path.join(ROOT_DIR, 'utils', 'badge_images(extra).py'),
+    'badge_certificates': os.path.join(ROOT_DIR, 'badge_certificates.py')
+}
+
+
+class FrozenDatetime(datetime):
+    """datetime whose now() is fixed, so dated certificates are reproducible"""
+
+    @classmethod
+    def now(cls, tz=None):
+        return FROZEN_NOW
+
+
+def load_renderer(name: str):
+    """Import a renderer module by file path (one of them has no importable name)"""
+    spec = importlib.util.spec_from_file_location(f'render_suite_{name}', RENDERERS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if hasattr(module, 'datetime'):
+        module.datetime = FrozenDatetime
+    return module
+
+
+def rank_stats(rank: int) -> dict:
+    """Deterministic leaderboard row for a rank"""
+    total = 2000 - rank * 15
+    correct = int(total * (0.95 - rank * 0.003))
+    return {
+        'points': 5000 - rank * 40,
+        'correct': correct,
+        'total': total,
+        'accuracy': round(correct / total * 100, 1),
+        'tests_taken': 200 - rank
+    }
+
+
+def render_rank(module, rank: int) -> BytesIO:
+    stats = rank_stats(rank)
+    if hasattr(module, 'generate_leaderboard_certificate'):
+        return module.generate_leaderboard_certificate(
+            rank=rank, username=USERNAME, points=stats['points'],
+            correct=stats['correct'], total=stats['total'],
+            accuracy=stats['accuracy'], tests_taken=stats['tests_taken']
+        )
+    return module.generate_leaderboard_rank_image(
+        rank=rank, username=USERNAME, points=stats['points'], stats=stats
+    )
+
+
+def cases(ranks: int):
+    """(case name, kind, argument) for every badge and rank 1..ranks"""
+    from handlers.badges import BADGE_DEFINITIONS
+
+    for badge_id, badge in BADGE_DEFINITIONS.items():
+        yield f'badge_{badge_id}', 'badge', badge
+    for rank in range(1, ranks + 1):
+        yield f'rank_{rank}', 'rank', rank
+
+
+def thumbnail(data: bytes):
+    from PIL import Image
+
+    img = Image.open(BytesIO(data)).convert('RGB')
+    return img.resize(GOLDEN_SIZE, Image.LANCZOS)
+
+
+def image_difference(a, b) -> float:
+    """Largest mean absolute per-channel difference over GOLDEN_TILE-sized tiles"""
+    from PIL import ImageChops, ImageStat
+
+    diff = ImageChops.difference(a, b)
+    width, height = diff.size
+    worst = 0.0
+    for top in range(0, height, GOLDEN_TILE):
+        for left in range(0, width, GOLDEN_TILE):
+            box = (left, top, min(width, left + GOLDEN_TILE), min(height, top + GOLDEN_TILE))
+            worst = max(worst, statistics.mean(ImageStat.Stat(diff.crop(box)).mean))
+    return worst
+
+
+def run_renderer(name: str, ranks: int, update_golden: bool, tolerance: float) -> dict:
+    """Benchmark one renderer (runs in its own process so peak RSS is its own)"""
+    module = load_renderer(name)
+    golden_dir = os.path.join(GOLDEN_DIR, name)
+    if update_golden:
+        os.makedirs(golden_dir, exist_ok=True)
+
+    timings = {'badge': [], 'rank': []}
+    sizes = {'badge': [], 'rank': []}
+    mismatches = []
+    missing = 0
+
+    for case, kind, arg in cases(ranks):
+        started = time.perf_counter()
+        if kind == 'badge':
+            output = module.generate_badge_certificate(arg['name'], arg['emoji'], USERNAME, DATE_EARNED)
+        else:
+            output = render_rank(module, arg)
+        timings[kind].append(time.perf_counter() - started)
+
+        data = output.getvalue()
+        sizes[kind].append(len(data))
+
+        if kind == 'rank' and arg not in GOLDEN_RANKS:
+            continue
+
+        golden_path = os.path.join(golden_dir, f'{case}.png')
+        thumb = thumbnail(data)
+        if update_golden:
+            thumb.save(golden_path, optimize=True)
+        elif os.path.exists(golden_path):
+            from PIL import Image
+            with Image.open(golden_path) as golden:
+                diff = image_difference(thumb, golden.convert('RGB'))
+            if diff > tolerance:
+                mismatches.append((case, round(diff, 2)))
+        else:
+            missing += 1
+
+    return {
+        'timings': timings,
+        'sizes': sizes,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'mismatches': mismatches,
+        'missing': missing
+    }
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark certificate renderers against golden images")
+    parser.add_argument('--ranks', type=int, default=100, help="render ranks 1..N")
+    parser.add_argument('--renderers', nargs='+', choices=sorted(RENDERERS), default=list(RENDERERS))
+    parser.add_argument('--update-golden', action='store_true', help="re-record golden thumbnails")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed worst-tile mean pixel difference (0-255)")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'renderer':<20} {'kind':<6} {'n':>4} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'avg KB':>8} {'peak RSS MB':>12}")
+
+    for name in args.renderers:
+        # Fresh process per renderer: peak RSS is a process-wide high-water mark
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            result = pool.submit(run_renderer, name, args.ranks, args.update_golden, args.tolerance).result()
+
+        for kind in ('badge', 'rank'):
+            timings = result['timings'][kind]
+            print(f"{name:<20} {kind:<6} {len(timings):>4} "
+                  f"{percentile(timings, 50) * 1000:>8.1f} {percentile(timings, 99) * 1000:>8.1f} "
+                  f"{statistics.mean(result['sizes'][kind]) / 1024:>8.1f} "
+                  f"{result['peak_rss_kb'] / 1024:>12.1f}")
+
+        if result['mismatches']:
+            failed = True
+            for case, diff in result['mismatches']:
+                print(f"   ❌ {name}/{case}: differs from golden by {diff}")
+        if result['missing']:
+            print(f"   ⚠️ {name}: {result['missing']} golden images missing (run with --update-golden)")
+
+    if args.update_golden:
+        print(f"\n✅ Golden images written to {GOLDEN_DIR}")
+    elif failed:
+        print("\n❌ Rendering differs from golden images")
+        sys.exit(1)
+    else:
+        print("\n✅ All renders match golden images")
@@ -14,6 +14,17 @@ TOKEN = os.getenv("BOT_TOKEN", "")
 # Admin Telegram user ID (get from @userinfobot) - LOAD FROM ENVIRONMENT
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 
+# Storage and certificate settings live in settings.py so offline tools can
+# use them without bot credentials
+from settings import (
+    DB_PATH,
+    DB_JOURNAL_MODE,
+    DB_CACHE_SIZE,
+    DB_MMAP_SIZE,
+    CERTIFICATE_BYTE_BUDGET,
+    CERTIFICATE_ENCODER_LADDER
+)
+
 # Category definitions
 CATEGORIES = {
     'a': {
@@ -49,6 +60,21 @@ def get_category_id(letter):
     """Get category ID from letter"""
     return CATEGORIES.get(letter, {}).get('id', 'mixed')
 
+__all__ = [
+    'TOKEN',
+    'ADMIN_ID',
+    'DB_PATH',
+    'DB_JOURNAL_MODE',
+    'DB_CACHE_SIZE',
+    'DB_MMAP_SIZE',
+    'CERTIFICATE_BYTE_BUDGET',
+    'CERTIFICATE_ENCODER_LADDER',
+    'CATEGORIES',
+    'CATEGORY_MAP',
+    'get_category_name',
+    'get_category_id'
+]
+
 # Validate configuration
 if not TOKEN:
     raise ValueError("BOT_TOKEN not found in environment variables!")
@@ -70,7 +70,8 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"d = 🧠 Aralash\n\n"
         f"━━━━━━━━━━━━━━━━━━━━\n\n"
         f"🔧 /tools - Tahrirlash, o'chirish, qidirish\n"
-        f"📢 /broadcast - Hammaga xabar yuborish"
+        f"📢 /broadcast - Hammaga xabar yuborish\n"
+        f"🏆 /rebuild_leaderboard - Reytingni qayta hisoblash"
     )
     
     # Check if this is from callback or message
@@ -4,6 +4,7 @@ Advanced admin tools for question management
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+import asyncio
 import config
 from database import load_questions, save_questions, get_category_stats, get_total_count
 
@@ -446,3 +447,52 @@ async def export_questions(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # For imports
 from datetime import datetime
+
+async def rebuild_leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Audit leaderboard and rebuild it from user statistics in the background"""
+    user_id = update.effective_user.id
+    
+    if user_id != config.ADMIN_ID:
+        await update.message.reply_text("❌ Ruxsat yo'q")
+        return
+    
+    from handlers.leaderboard import audit_leaderboard, rebuild_leaderboard
+    
+    audit = audit_leaderboard()
+    status_msg = await update.message.reply_text(
+        f"🔍 Reyting tekshiruvi:\n"
+        f"  • Haftalik: {audit['weekly']} ta xato\n"
+        f"  • Oylik: {audit['monthly']} ta xato\n"
+        f"  • Barcha vaqt: {audit['alltime']} ta xato\n"
+        f"  • Yangilanishda: {audit['online_violations']} ta xato\n\n"
+        f"⏳ Qayta hisoblanmoqda..."
+    )
+    
+    last_edit = [0.0]
+    
+    async def report_progress(done: int, total: int):
+        # Telegram limits message edits, so report at most every 2 seconds
+        now = asyncio.get_running_loop().time()
+        if done < total and now - last_edit[0] < 2:
+            return
+        last_edit[0] = now
+        percentage = (done / total * 100) if total > 0 else 100
+        try:
+            await status_msg.edit_text(f"⏳ Qayta hisoblanmoqda: {done}/{total} ({percentage:.0f}%)")
+        except Exception:
+            pass
+    
+    async def run_rebuild():
+        try:
+            counts = await rebuild_leaderboard(progress=report_progress)
+            await status_msg.edit_text(
+                f"✅ Reyting qayta hisoblandi!\n\n"
+                f"  • Haftalik: {counts['weekly']}\n"
+                f"  • Oylik: {counts['monthly']}\n"
+                f"  • Barcha vaqt: {counts['alltime']}"
+            )
+        except Exception as e:
+            print(f"Error rebuilding leaderboard: {e}")
+            await status_msg.edit_text(f"❌ Xatolik: {str(e)}")
+    
+    context.application.create_task(run_rebuild())
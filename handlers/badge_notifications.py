@@ -0,0 +1,176 @@
+"""
+Badge notification queue
+New badges are announced from a background task, so the test result is
+never held up by certificate rendering or photo uploads. Unlocks of the
+same user arriving within a short window are sent together as one album.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+
+from telegram.error import BadRequest
+
+from handlers.badges import (
+    BADGE_DEFINITIONS,
+    badge_caption,
+    badge_summary_text,
+    forget_certificate_file_ids,
+    get_badge_certificate,
+    get_certificate_username,
+    remember_certificate_upload
+)
+from utils import certificate_cache
+
+# Seconds to wait for more unlocks of the same user before sending
+BADGE_NOTIFY_COALESCE_SECONDS = 2.0
+# Global limit for badge messages (Telegram allows ~30 messages/second per bot)
+BADGE_NOTIFY_RATE = 20
+# Telegram media group size limit
+MEDIA_GROUP_LIMIT = 10
+
+_queue = None  # asyncio.Queue of (ready_at, user_id)
+_pending: Dict[int, List[str]] = {}  # user_id -> badge IDs waiting to be sent
+_worker = None
+_bot = None
+_next_send_at = 0.0
+
+
+def enqueue_badge_notifications(context, user_id: int, badge_ids: List[str]) -> None:
+    """
+    Queue notifications for newly earned badges (returns immediately)
+
+    Args:
+        context: Handler context (its bot is used for sending)
+        user_id: Telegram user ID
+        badge_ids: Newly earned badge IDs
+    """
+    global _queue, _worker, _bot
+
+    badge_ids = [b for b in badge_ids if b in BADGE_DEFINITIONS]
+    if not badge_ids or context is None:
+        return
+
+    _bot = context.bot
+    if _queue is None:
+        _queue = asyncio.Queue()
+    if _worker is None or _worker.done():
+        _worker = asyncio.get_running_loop().create_task(_notification_worker())
+
+    if user_id in _pending:
+        # Already queued - ride along with the earlier unlocks
+        _pending[user_id].extend(b for b in badge_ids if b not in _pending[user_id])
+        return
+
+    _pending[user_id] = list(badge_ids)
+    _queue.put_nowait((time.monotonic() + BADGE_NOTIFY_COALESCE_SECONDS, user_id))
+
+
+async def _throttle(messages: int) -> None:
+    """Wait for a global send slot worth `messages` messages"""
+    global _next_send_at
+
+    now = time.monotonic()
+    if _next_send_at > now:
+        await asyncio.sleep(_next_send_at - now)
+        now = _next_send_at
+    _next_send_at = now + messages / BADGE_NOTIFY_RATE
+
+
+async def _notification_worker() -> None:
+    """Send queued notifications in order, one user at a time"""
+    while True:
+        ready_at, user_id = await _queue.get()
+        try:
+            delay = ready_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            badge_ids = _pending.pop(user_id, [])
+            if badge_ids:
+                await _send_badges(user_id, badge_ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Error in badge notification worker: {e}")
+        finally:
+            _queue.task_done()
+
+
+async def _send_album(user_id: int, group: List[str], certificates: List[Tuple]) -> Tuple:
+    """Send certificates of a group of badges as one album"""
+    # Album caption is shown under the first photo
+    media = [
+        InputMediaPhoto(
+            media=certificate,
+            caption=badge_summary_text(group) if i == 0 else None,
+            parse_mode='HTML' if i == 0 else None
+        )
+        for i, (certificate, _) in enumerate(certificates)
+    ]
+    await _throttle(len(media))
+    return await _bot.send_media_group(chat_id=user_id, media=media)
+
+
+async def _send_badges(user_id: int, badge_ids: List[str]) -> None:
+    """Send one photo, or albums of certificates, for a user's new badges"""
+    username = await get_certificate_username(_bot, user_id)
+
+    try:
+        if len(badge_ids) == 1:
+            async def send(certificate):
+                await _throttle(1)
+                return await _bot.send_photo(
+                    chat_id=user_id,
+                    photo=certificate,
+                    caption=badge_caption(badge_ids[0]),
+                    parse_mode='HTML'
+                )
+
+            await certificate_cache.send_certificate(
+                send, lambda: get_badge_certificate(badge_ids[0], username)
+            )
+        else:
+            for start in range(0, len(badge_ids), MEDIA_GROUP_LIMIT):
+                group = badge_ids[start:start + MEDIA_GROUP_LIMIT]
+                certificates = await asyncio.gather(
+                    *(get_badge_certificate(badge_id, username) for badge_id in group)
+                )
+                try:
+                    messages = await _send_album(user_id, group, certificates)
+                except BadRequest as e:
+                    # Telegram doesn't say which file_id it rejected: upload
+                    # every certificate of the album that was sent by file_id
+                    if not await forget_certificate_file_ids(certificates):
+                        raise
+                    print(f"Cached certificate file_id rejected, uploading again: {e}")
+                    certificates = await asyncio.gather(
+                        *(get_badge_certificate(badge_id, username) for badge_id in group)
+                    )
+                    messages = await _send_album(user_id, group, certificates)
+                for (_, key), message in zip(certificates, messages):
+                    await remember_certificate_upload(key, message)
+
+        print(f"✅ {len(badge_ids)} badge certificate(s) sent to user {user_id}")
+
+    except Exception as e:
+        print(f"❌ Error sending badge certificates: {e}")
+        # Fallback to one summary message
+        keyboard = [[InlineKeyboardButton("🏅 Mening nishonlarim", callback_data="badges_my")]]
+        try:
+            await _throttle(1)
+            await _bot.send_message(
+                chat_id=user_id,
+                text=badge_summary_text(badge_ids),
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode='HTML'
+            )
+        except Exception as e2:
+            print(f"Error sending fallback notification: {e2}")
+
+
+__all__ = [
+    'enqueue_badge_notifications'
+]
@@ -4,8 +4,20 @@ Badge System - Achievement badges with improved UI and Telegraph integration
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils.badge_images import generate_badge_certificate
-from typing import Dict, List, Set
+from utils.badge_images import generate_badge_certificate, BADGE_TEMPLATE
+from utils.badge_rules import (
+    parse_requirement,
+    compile_rule,
+    build_badge_context,
+    build_dependency_index,
+    next_thresholds,
+    gate_open,
+    rule_progress
+)
+from utils import badge_store, render_service, certificate_cache
+from utils.db import run_db
+from typing import Dict, List, Set, Tuple, Union
+from io import BytesIO
 import json
 from datetime import datetime
 
@@ -164,11 +176,33 @@ BADGE_DEFINITIONS = {
     }
 }
 
+# Requirements parsed once at import into structured rules and compiled checks
+BADGE_RULES = {
+    badge_id: parse_requirement(badge_def['requirement'])
+    for badge_id, badge_def in BADGE_DEFINITIONS.items()
+}
+BADGE_CHECKS = {
+    badge_id: compile_rule(rule)
+    for badge_id, rule in BADGE_RULES.items()
+}
+
+# Bit of each badge in the stored bitmask.
+# Ordinals follow BADGE_DEFINITIONS order - only ever append new badges.
+BADGE_BITS = {badge_id: 1 << ordinal for ordinal, badge_id in enumerate(BADGE_DEFINITIONS)}
+
+# metric -> badges that depend on it
+BADGE_DEPENDENCIES = build_dependency_index(BADGE_RULES)
+
+# Per-user evaluation state: earned bitmask, last seen badge context and next unmet thresholds
+# {user_key: {'mask': int, 'context': {...}, 'gates': {metric: [Condition, ...]}}}
+_badge_state = {}
+_legacy_imported = False
+
 # Telegraph page URL for all badges (you'll need to create this)
 TELEGRAPH_ALL_BADGES_URL = "https://telegra.ph/PDD-Test-Bot---Barcha-Yutuq-Nishonlari-01-15"
 
 def load_user_badges() -> Dict:
-    """Load user badges"""
+    """Load legacy user_badges.json (pre-SQLite storage)"""
     try:
         with open(BADGES_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
@@ -178,161 +212,197 @@ def load_user_badges() -> Dict:
         print(f"Error loading badges: {e}")
         return {}
 
-def save_user_badges(badges: Dict) -> None:
-    """Save user badges"""
-    try:
-        with open(BADGES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(badges, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving badges: {e}")
+def load_legacy_awards() -> Dict[int, Tuple[int, Dict[str, str]]]:
+    """user_id -> (badge bitmask, {badge_id: earn date}) from user_badges.json"""
+    awards = {}
+    for user_key, user_badges in load_user_badges().items():
+        bits = 0
+        for badge_id in user_badges.get('earned_badges', []):
+            bits |= BADGE_BITS.get(badge_id, 0)
+        dates = {
+            badge_id: earned_at
+            for badge_id, earned_at in user_badges.get('badge_dates', {}).items()
+            if badge_id in BADGE_BITS
+        }
+        awards[int(user_key)] = (bits, dates)
+    return awards
 
-def check_and_award_badges(user_id: int, user_stats: Dict) -> List[str]:
+def ensure_badge_storage() -> None:
+    """Import user_badges.json into SQLite once, if the badge tables are empty"""
+    global _legacy_imported
+    
+    if _legacy_imported:
+        return
+    _legacy_imported = True
+    
+    if not badge_store.is_empty():
+        return
+    
+    awards = load_legacy_awards()
+    if awards and badge_store.award_badges(awards):
+        print(f"✅ Imported badges of {len(awards)} users from {BADGES_FILE}")
+
+def mask_to_badge_ids(mask: int) -> Set[str]:
+    """Badge IDs set in a bitmask"""
+    return {badge_id for badge_id, bit in BADGE_BITS.items() if mask & bit}
+
+def _load_badge_mask(user_id: int) -> int:
+    """Stored badge bitmask (blocking - run on the database thread)"""
+    ensure_badge_storage()
+    return badge_store.get_badge_mask(user_id)
+
+def get_badge_mask(user_id: int) -> int:
+    """Earned badge bitmask from cached profile, falling back to storage"""
+    state = _badge_state.get(str(user_id))
+    if state is not None:
+        return state['mask']
+    
+    return _load_badge_mask(user_id)
+
+def _store_new_badges(user_id: int, new_bits: int, new_dates: Dict[str, str]) -> Union[int, None]:
+    """
+    Store badges the user doesn't have yet (run on the database thread)
+    
+    The stored mask is re-read first: the cached one may be stale if
+    backfill_badges.py ran meanwhile.
+    
+    Returns:
+        Stored mask before this award, or None if saving failed
+    """
+    stored = badge_store.get_badge_mask(user_id)
+    new_bits &= ~stored
+    if new_bits:
+        dates = {b: d for b, d in new_dates.items() if new_bits & BADGE_BITS[b]}
+        if not badge_store.award_badges({user_id: (new_bits, dates)}):
+            return None
+    return stored
+
+async def check_and_award_badges(user_id: int, user_stats: Dict) -> List[str]:
     """
     Check if user earned any new badges
     Returns list of newly earned badge IDs
+    
+    Only badges depending on metrics that changed since the user's last
+    check are evaluated, and only if a changed metric reached its next
+    unmet threshold.
     """
-    badges_data = load_user_badges()
     user_key = str(user_id)
     
-    if user_key not in badges_data:
-        badges_data[user_key] = {
-            'earned_badges': [],
-            'badge_dates': {}
+    # Build context once for all badges
+    context = build_badge_context(user_stats)
+    
+    candidates = None  # None = evaluate every badge
+    state = _badge_state.get(user_key)
+    if state is not None:
+        previous = state['context']
+        gates = state['gates']
+        state['context'] = context
+        
+        unlocked_metrics = [
+            metric for metric, value in context.items()
+            if value != previous.get(metric) and gate_open(gates.get(metric, ()), value)
+        ]
+        if not unlocked_metrics:
+            return []
+        
+        candidates = {
+            badge_id
+            for metric in unlocked_metrics
+            for badge_id in BADGE_DEPENDENCIES.get(metric, ())
         }
     
-    user_badges = badges_data[user_key]
+    mask = state['mask'] if state is not None else await run_db(_load_badge_mask, user_id)
+    new_bits = 0
+    new_dates = {}
     newly_earned = []
     
-    # Check each badge
-    for badge_id, badge_def in BADGE_DEFINITIONS.items():
-        # Skip if already earned
-        if badge_id in user_badges['earned_badges']:
+    # Check each candidate badge
+    for badge_id, check in BADGE_CHECKS.items():
+        # Skip if already earned or unaffected by this change
+        if mask & BADGE_BITS[badge_id] or (candidates is not None and badge_id not in candidates):
             continue
         
-        # Evaluate requirement
-        requirement = badge_def['requirement']
-        
-        # Build context for eval
-        context = {
-            'questions_solved': user_stats.get('total_questions', 0),
-            'correct_answers': user_stats.get('correct_answers', 0),
-            'tests_taken': user_stats.get('tests_taken', 0),
-            'accuracy': user_stats.get('accuracy', 0),
-            'perfect_scores': user_stats.get('perfect_scores', 0),
-            'exams_passed': user_stats.get('exams_passed', 0),
-            'daily_streak': user_stats.get('daily_streak', 0),
-            'tests_in_day': user_stats.get('tests_in_day', 0),
-            'night_tests': user_stats.get('night_tests', 0),
-            'early_tests': user_stats.get('early_tests', 0),
-            'wrong_questions_corrected': user_stats.get('wrong_questions_corrected', 0),
-            'top_rank': user_stats.get('top_rank', 999)
-        }
-        
         try:
-            if eval(requirement, {"__builtins__": {}}, context):
+            if check(context):
                 # Award badge
-                user_badges['earned_badges'].append(badge_id)
-                user_badges['badge_dates'][badge_id] = datetime.now().isoformat()
+                new_bits |= BADGE_BITS[badge_id]
+                new_dates[badge_id] = datetime.now().isoformat()
                 newly_earned.append(badge_id)
         except Exception as e:
             print(f"Error checking badge {badge_id}: {e}")
     
     if newly_earned:
-        save_user_badges(badges_data)
+        stored = await run_db(_store_new_badges, user_id, new_bits, new_dates)
+        if stored is None:
+            return []
+        newly_earned = [b for b in newly_earned if not stored & BADGE_BITS[b]]
+        mask |= stored | new_bits
+    
+    _badge_state[user_key] = {
+        'mask': mask,
+        'context': context,
+        'gates': next_thresholds(BADGE_RULES, mask_to_badge_ids(mask), context)
+    }
     
     return newly_earned
 
 def get_user_badges(user_id: int) -> List[Dict]:
-    """Get all badges earned by user"""
-    badges_data = load_user_badges()
-    user_key = str(user_id)
-    
-    if user_key not in badges_data:
-        return []
-    
-    user_badges = badges_data[user_key]['earned_badges']
-    badge_dates = badges_data[user_key]['badge_dates']
+    """Get all badges earned by user (in the order they were earned)"""
+    ensure_badge_storage()
+    badge_dates = badge_store.get_badge_dates(user_id)
     
     result = []
-    for badge_id in user_badges:
+    for badge_id, earned_date in sorted(badge_dates.items(), key=lambda item: item[1]):
         if badge_id in BADGE_DEFINITIONS:
             badge_info = BADGE_DEFINITIONS[badge_id].copy()
             badge_info['id'] = badge_id
-            badge_info['earned_date'] = badge_dates.get(badge_id, 'Unknown')
+            badge_info['earned_date'] = earned_date
             result.append(badge_info)
     
     return result
 
-def get_badge_progress(user_stats: Dict) -> List[Dict]:
-    """Get progress towards unearned badges"""
-    badges_data = load_user_badges()
-    user_id = user_stats.get('user_id', 0)
-    user_key = str(user_id)
-    
-    earned_ids = []
-    if user_key in badges_data:
-        earned_ids = badges_data[user_key]['earned_badges']
-    
-    progress = []
+async def fetch_user_badges(user_id: int) -> List[Dict]:
+    """get_user_badges() run on the database thread"""
+    return await run_db(get_user_badges, user_id)
+
+def get_badge_progress(user_stats: Dict, limit: int = 5, mask: int = None) -> List[Dict]:
+    """Get progress towards unearned badges, closest to completion first"""
+    if mask is None:
+        mask = get_badge_mask(user_stats.get('user_id', 0))
     
     # Build context
-    context = {
-        'questions_solved': user_stats.get('total_questions', 0),
-        'correct_answers': user_stats.get('correct_answers', 0),
-        'tests_taken': user_stats.get('tests_taken', 0),
-        'accuracy': user_stats.get('accuracy', 0),
-        'perfect_scores': user_stats.get('perfect_scores', 0),
-        'exams_passed': user_stats.get('exams_passed', 0),
-        'daily_streak': user_stats.get('daily_streak', 0),
-        'tests_in_day': user_stats.get('tests_in_day', 0),
-        'night_tests': user_stats.get('night_tests', 0),
-        'early_tests': user_stats.get('early_tests', 0),
-        'wrong_questions_corrected': user_stats.get('wrong_questions_corrected', 0),
-        'top_rank': user_stats.get('top_rank', 999)
-    }
+    context = build_badge_context(user_stats)
     
-    for badge_id, badge_def in BADGE_DEFINITIONS.items():
+    progress = []
+    for badge_id, rule in BADGE_RULES.items():
         # Skip earned badges
-        if badge_id in earned_ids:
+        if mask & BADGE_BITS[badge_id]:
             continue
         
-        # Parse requirement to show progress
-        req = badge_def['requirement']
-        
-        # Simple progress tracking for numeric requirements
-        if 'questions_solved >=' in req:
-            target = int(req.split('>=')[1].strip().split()[0])
-            current = context['questions_solved']
-            if current < target:
-                progress.append({
-                    'badge': badge_def,
-                    'current': current,
-                    'target': target,
-                    'percentage': min(100, int((current / target) * 100))
-                })
+        result = rule_progress(rule, context)
+        if result['progress'] >= 1.0:
+            continue
         
-        elif 'tests_taken >=' in req:
-            target = int(req.split('>=')[1].strip().split()[0])
-            current = context['tests_taken']
-            if current < target:
-                progress.append({
-                    'badge': badge_def,
-                    'current': current,
-                    'target': target,
-                    'percentage': min(100, int((current / target) * 100))
-                })
+        progress.append({
+            'id': badge_id,
+            'badge': BADGE_DEFINITIONS[badge_id],
+            'metric': result['metric'],
+            'current': result['current'],
+            'target': result['target'],
+            'percentage': int(result['progress'] * 100)
+        })
     
     # Sort by percentage (closest to completion first)
     progress.sort(key=lambda x: x['percentage'], reverse=True)
     
-    return progress[:5]  # Return top 5 closest badges
+    return progress[:limit]
 
 async def badges_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show badges main menu"""
     user_id = update.effective_user.id
     
     # Get user badges
-    badges = get_user_badges(user_id)
+    badges = await fetch_user_badges(user_id)
     badge_count = len(badges)
     total_badges = len(BADGE_DEFINITIONS)
     
@@ -387,7 +457,7 @@ async def show_my_badges(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_stats['user_id'] = user_id
     
     # Get badges
-    badges = get_user_badges(user_id)
+    badges = await fetch_user_badges(user_id)
     
     if not badges:
         text = (
@@ -445,6 +515,19 @@ async def show_my_badges(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if len(common) > 10:
             text += f"\n... va yana {len(common) - 10} ta nishon\n"
     
+    # Closest badges to unlock
+    earned_mask = 0
+    for badge in badges:
+        earned_mask |= BADGE_BITS[badge['id']]
+    next_badges = get_badge_progress(user_stats, limit=3, mask=earned_mask)
+    if next_badges:
+        text += "\n<b>🎯 Keyingi nishonlar:</b>\n"
+        for item in next_badges:
+            text += (
+                f"{item['badge']['emoji']} {item['badge']['name']} - "
+                f"{item['current']}/{item['target']} ({item['percentage']}%)\n"
+            )
+    
     text += "\n💡 Har bir nishon uchun sertifikat olishingiz mumkin!"
     
     # Keyboard with share option
@@ -468,50 +551,109 @@ async def show_all_badges(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # This will be handled by the URL button in the keyboard
 
-async def notify_new_badge(context: ContextTypes.DEFAULT_TYPE, user_id: int, badge_id: str):
-    """Send notification with certificate image when user earns a new badge"""
-    if badge_id not in BADGE_DEFINITIONS:
-        return
-    
-    badge = BADGE_DEFINITIONS[badge_id]
-    
-    # Get username
+async def get_certificate_username(bot, user_id: int) -> str:
+    """Name printed on a user's certificates"""
     try:
-        chat = await context.bot.get_chat(user_id)
+        chat = await bot.get_chat(user_id)
         if chat.username:
-            username = chat.username
+            return chat.username
         elif chat.first_name:
-            username = chat.first_name
-        else:
-            username = f"User{user_id}"
+            return chat.first_name
     except Exception as e:
         print(f"Error getting username: {e}")
-        username = f"User{user_id}"
+    return f"User{user_id}"
+
+async def get_badge_certificate(badge_id: str, username: str) -> Tuple[Union[str, BytesIO], str]:
+    """
+    Certificate for an earned badge, from cache or rendered off the event loop
     
-    # Generate certificate image
-    try:
-        date_earned = datetime.now().strftime('%d.%m.%Y')
-        certificate = generate_badge_certificate(
-            badge_name=badge['name'],
-            badge_emoji=badge['emoji'],
-            username=username,
-            date_earned=date_earned
-        )
-        
-        # Caption text
-        caption = (
-            f"🎉 <b>YANGI YUTUQ!</b> 🎉\n\n"
+    Returns:
+        (Telegram file_id or image BytesIO, cache key)
+    """
+    badge = BADGE_DEFINITIONS[badge_id]
+    date_earned = datetime.now().strftime('%d.%m.%Y')
+    key = certificate_cache.certificate_key(BADGE_TEMPLATE, badge_id, username, date_earned)
+    
+    cached = await certificate_cache.run_io(certificate_cache.get, key)
+    if cached is not None:
+        return cached, key
+    
+    certificate = await render_service.render(
+        generate_badge_certificate,
+        badge_name=badge['name'],
+        badge_emoji=badge['emoji'],
+        username=username,
+        date_earned=date_earned
+    )
+    await certificate_cache.run_io(certificate_cache.put, key, certificate)
+    return certificate, key
+
+async def remember_certificate_upload(key: str, message) -> None:
+    """Store file_id of a sent certificate so it is never uploaded again"""
+    if message is not None and message.photo:
+        await certificate_cache.run_io(certificate_cache.set_file_id, key, message.photo[-1].file_id)
+
+async def forget_certificate_file_ids(certificates: List[Tuple[Union[str, BytesIO], str]]) -> bool:
+    """
+    Drop the file_ids among certificates after Telegram rejected a send
+
+    Returns:
+        True if any certificate was sent by file_id (worth sending again)
+    """
+    rejected = [key for certificate, key in certificates if isinstance(certificate, str)]
+    for key in rejected:
+        await certificate_cache.run_io(certificate_cache.drop_file_id, key)
+    return bool(rejected)
+
+def badge_caption(badge_id: str) -> str:
+    """Caption sent with a badge certificate"""
+    badge = BADGE_DEFINITIONS[badge_id]
+    return (
+        f"🎉 <b>YANGI YUTUQ!</b> 🎉\n\n"
+        f"{badge['emoji']} <b>{badge['name']}</b>\n\n"
+        f"{badge['description']}\n\n"
+        f"Tabriklaymiz! Do'stlaringiz bilan ulashing! 👆"
+    )
+
+def badge_summary_text(badge_ids: List[str]) -> str:
+    """Text notification listing one or more new badges"""
+    if len(badge_ids) == 1:
+        badge = BADGE_DEFINITIONS[badge_ids[0]]
+        return (
+            f"🎉 <b>YANGI NISHON!</b> 🎉\n\n"
             f"{badge['emoji']} <b>{badge['name']}</b>\n\n"
             f"{badge['description']}\n\n"
-            f"Tabriklaymiz! Do'stlaringiz bilan ulashing! 👆"
+            f"Tabriklaymiz! Davom eting! 🚀"
         )
-        
-        # Send certificate image
-        await context.bot.send_photo(
-            chat_id=user_id,
-            photo=certificate,
-            caption=caption,
-            parse_mode='HTML'
+    
+    lines = "\n".join(
+        f"{BADGE_DEFINITIONS[b]['emoji']} <b>{BADGE_DEFINITIONS[b]['name']}</b> - {BADGE_DEFINITIONS[b]['description']}"
+        for b in badge_ids
+    )
+    return (
+        f"🎉 <b>{len(badge_ids)} TA YANGI NISHON!</b> 🎉\n\n"
+        f"{lines}\n\n"
+        f"Tabriklaymiz! Davom eting! 🚀"
+    )
+
+async def notify_new_badge(context: ContextTypes.DEFAULT_TYPE, user_id: int, badge_id: str):
+    """Send notification with certificate image when user earns a new badge"""
+    if badge_id not in BADGE_DEFINITIONS:
+        return
+    
+    badge = BADGE_DEFINITIONS[badge_id]
+    username = await get_certificate_username(context.bot, user_id)
+    
+    # Generate certificate image
+    try:
+        await certificate_cache.send_certificate(
+            lambda certificate: context.bot.send_photo(
+                chat_id=user_id,
+                photo=certificate,
+                caption=badge_caption(badge_id),
+                parse_mode='HTML'
+            ),
+            lambda: get_badge_certificate(badge_id, username)
         )
         
         print(f"✅ Badge certificate sent to user {user_id}: {badge['name']}")
@@ -519,19 +661,12 @@ async def notify_new_badge(context: ContextTypes.DEFAULT_TYPE, user_id: int, bad
     except Exception as e:
         print(f"❌ Error sending badge certificate: {e}")
         # Fallback to text notification if image fails
-        text = (
-            f"🎉 <b>YANGI NISHON!</b> 🎉\n\n"
-            f"{badge['emoji']} <b>{badge['name']}</b>\n\n"
-            f"{badge['description']}\n\n"
-            f"Tabriklaymiz! Davom eting! 🚀"
-        )
-        
         keyboard = [[InlineKeyboardButton("🏅 Mening nishonlarim", callback_data="badges_my")]]
         
         try:
             await context.bot.send_message(
                 chat_id=user_id,
-                text=text,
+                text=badge_summary_text([badge_id]),
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode='HTML'
             )
@@ -545,6 +680,8 @@ __all__ = [
     'show_all_badges',
     'check_and_award_badges',
     'get_user_badges',
+    'fetch_user_badges',
+    'get_badge_progress',
     'notify_new_badge',
     'BADGE_DEFINITIONS'
 ]
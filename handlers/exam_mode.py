@@ -59,16 +59,6 @@ class ExamSession:
             self.correct += 1
 
 
-async def start_exam(update, context):
-    user_id = update.effective_user.id
-    
-    # Check daily limit
-    limit_check = await SubscriptionManager.check_daily_limit(user_id)
-    if not limit_check['allowed']:
-        # Show upgrade prompt
-        # (see example in exam_premium_integration.py)
-        return
-
 async def exam_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start timed exam mode"""
     user_id = update.effective_user.id
@@ -134,6 +124,17 @@ async def start_exam(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
+        # Check daily limit and count this test
+        limit_check = await SubscriptionManager.reserve_test_slot(user_id)
+        if not limit_check['allowed']:
+            keyboard = [[InlineKeyboardButton("💎 Premium", callback_data="premium_menu")]]
+            await query.edit_message_text(
+                f"⛔ Bugungi limit tugadi: {limit_check['limit']} ta test.\n\n"
+                f"Ertaga yana urinib ko'ring yoki cheksiz testlar uchun Premium oling.",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+            return
+        
         # Create exam session
         session = ExamSession(user_id, questions)
         exam_sessions[user_id] = session
@@ -4,12 +4,46 @@ Leaderboard System - Weekly, Monthly, All-time rankings
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils.badge_images import generate_leaderboard_certificate
+from utils.badge_images import generate_leaderboard_certificate, RANK_TEMPLATE
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple
+from bisect import bisect_left, insort
+from io import BytesIO
+from utils.rank_sketch import PointsSketch
+from utils import render_service, certificate_cache
+import asyncio
+import heapq
+import atexit
 import json
+import math
+import os
 
 LEADERBOARD_FILE = 'leaderboard.json'
+PERIODS = ('weekly', 'monthly', 'alltime')
+
+# Seconds to coalesce leaderboard changes before writing them to disk
+LEADERBOARD_FLUSH_INTERVAL = 5
+
+# Users below this rank get an approximate "top N%" from the points sketch
+LEADERBOARD_EXACT_TOP_K = 100
+
+# In-memory leaderboard state (loaded once, persisted in batches)
+_leaderboard_data = None
+_rank_index = {}    # period -> sorted top-K list of (-points, seq, user_key)
+_index_keys = {}    # period -> {user_key: (-points, seq)} for every user
+_sketches = {}      # period -> PointsSketch over every user's points
+
+# All-time top users whose rank certificates are pre-rendered at period close
+RANK_CERTIFICATE_PRERENDER_TOP_N = 10
+
+# Number of leaderboard rows that failed the online invariant check
+_invariant_violations = 0
+# (period, user key) pairs already warned about, so a broken row is reported once
+_invariant_reported = set()
+_dirty = False
+_flush_handle = None
+# Updates made while rebuild_leaderboard runs, replayed onto the rebuilt tables
+_rebuild_deltas = None
 
 def load_leaderboard_data() -> Dict:
     """Load leaderboard data"""
@@ -38,64 +72,444 @@ def load_leaderboard_data() -> Dict:
             }
         }
 
-def save_leaderboard_data(data: Dict) -> None:
-    """Save leaderboard data"""
+def save_leaderboard_data(data: Dict) -> bool:
+    """Save leaderboard data (True if written)"""
     try:
-        with open(LEADERBOARD_FILE, 'w', encoding='utf-8') as f:
+        tmp_file = f"{LEADERBOARD_FILE}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, LEADERBOARD_FILE)
+        return True
     except Exception as e:
         print(f"Error saving leaderboard: {e}")
+        return False
+
+def get_leaderboard_data() -> Dict:
+    """Get in-memory leaderboard data, loading it from disk on first use"""
+    global _leaderboard_data
+    
+    if _leaderboard_data is None:
+        _leaderboard_data = load_leaderboard_data()
+        for period in PERIODS:
+            _leaderboard_data.setdefault(period, {})
+            _rebuild_rank_index(period)
+    
+    return check_and_reset_periods(_leaderboard_data)
+
+def _rebuild_rank_index(period: str) -> None:
+    """Build rank index and points sketch for a period from in-memory data"""
+    keys = {}
+    sketch = PointsSketch()
+    for seq, (user_key, stats) in enumerate(_leaderboard_data[period].items()):
+        points = _entry_points(stats)
+        keys[user_key] = (-points, seq)
+        sketch.add(points)
+    
+    _index_keys[period] = keys
+    _sketches[period] = sketch
+    _rebuild_top_k(period)
+
+def _rebuild_top_k(period: str) -> None:
+    """Recompute exact top-K list from all users of a period"""
+    _rank_index[period] = heapq.nsmallest(
+        LEADERBOARD_EXACT_TOP_K,
+        ((key[0], key[1], user_key) for user_key, key in _index_keys[period].items())
+    )
+
+def _update_rank_index(period: str, user_key: str, stats: Dict) -> None:
+    """Move user to their new position in the period rank index"""
+    keys = _index_keys[period]
+    index = _rank_index[period]
+    sketch = _sketches[period]
+    
+    old_key = keys.get(user_key)
+    if old_key is not None:
+        seq = old_key[1]
+        sketch.remove(-old_key[0])
+        pos = bisect_left(index, (old_key[0], seq, user_key))
+        if pos < len(index) and index[pos][2] == user_key:
+            del index[pos]
+    else:
+        seq = len(keys)
+    
+    points = _entry_points(stats)
+    new_key = (-points, seq)
+    keys[user_key] = new_key
+    sketch.add(points)
+    
+    entry = (new_key[0], new_key[1], user_key)
+    if len(index) < LEADERBOARD_EXACT_TOP_K or entry < index[-1]:
+        insort(index, entry)
+        del index[LEADERBOARD_EXACT_TOP_K:]
+    
+    # Someone left the top-K without being replaced: refill from all users
+    if len(index) < min(LEADERBOARD_EXACT_TOP_K, len(keys)):
+        _rebuild_top_k(period)
+
+def _entry_points(stats: Dict) -> int:
+    """Ranking points for a stored leaderboard entry"""
+    return calculate_ranking_points(
+        stats['questions_solved'],
+        stats['correct_answers'],
+        stats['tests_taken'],
+        stats['accuracy']
+    )
+
+def flush_leaderboard() -> None:
+    """Write pending leaderboard changes to disk"""
+    global _dirty, _flush_handle
+    
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+    
+    if not _dirty or _leaderboard_data is None:
+        return
+    
+    if save_leaderboard_data(_leaderboard_data):
+        _dirty = False
+        return
+    
+    # Changes stay pending: retry later, or on the next change / at exit
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    _flush_handle = loop.call_later(LEADERBOARD_FLUSH_INTERVAL, flush_leaderboard)
+
+def _schedule_flush() -> None:
+    """Mark leaderboard dirty and schedule a coalesced write"""
+    global _dirty, _flush_handle
+    _dirty = True
+    
+    if _flush_handle is not None:
+        return
+    
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop (scripts): write immediately
+        flush_leaderboard()
+        return
+    
+    _flush_handle = loop.call_later(LEADERBOARD_FLUSH_INTERVAL, flush_leaderboard)
+
+# Don't lose the last batch on shutdown
+atexit.register(flush_leaderboard)
 
 def check_and_reset_periods(data: Dict) -> Dict:
     """Check if weekly/monthly periods need reset"""
     now = datetime.now()
+    closed = []
     
     # Check weekly reset (every Monday)
     last_weekly = datetime.fromisoformat(data['last_reset']['weekly'])
     if now.weekday() == 0 and (now - last_weekly).days >= 7:
-        data['weekly'] = {}
-        data['last_reset']['weekly'] = now.isoformat()
+        _reset_period(data, 'weekly', now)
+        closed.append('weekly')
     
     # Check monthly reset (first day of month)
     last_monthly = datetime.fromisoformat(data['last_reset']['monthly'])
     if now.day == 1 and now.month != last_monthly.month:
-        data['monthly'] = {}
-        data['last_reset']['monthly'] = now.isoformat()
+        _reset_period(data, 'monthly', now)
+        closed.append('monthly')
+    
+    # Both periods can close at once; the all-time top is prerendered once
+    if closed and data is _leaderboard_data:
+        _on_period_closed()
     
     return data
 
+def _reset_period(data: Dict, period: str, now: datetime) -> None:
+    """Clear a period table and its rank index"""
+    data[period] = {}
+    data['last_reset'][period] = now.isoformat()
+    
+    if data is _leaderboard_data:
+        _index_keys[period] = {}
+        _rank_index[period] = []
+        _sketches[period].clear()
+        _invariant_reported.difference_update([key for key in _invariant_reported if key[0] == period])
+        _schedule_flush()
+
+def _on_period_closed() -> None:
+    """Warm rank certificate cache in the background when periods close"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    
+    loop.create_task(prerender_rank_certificates())
+
 def update_leaderboard(user_id: int, username: str, questions_solved: int, correct_answers: int, tests_taken: int) -> None:
-    """Update leaderboard for all periods"""
-    data = load_leaderboard_data()
-    data = check_and_reset_periods(data)
+    """Update leaderboard for all periods (persisted in coalesced batches)"""
+    data = get_leaderboard_data()
     
     user_key = str(user_id)
     
+    if _rebuild_deltas is not None:
+        _rebuild_deltas.append((user_id, username, questions_solved, correct_answers, tests_taken))
+    
     # Update all three periods
-    for period in ['weekly', 'monthly', 'alltime']:
-        if user_key not in data[period]:
-            data[period][user_key] = {
-                'user_id': user_id,
-                'username': username,
-                'questions_solved': 0,
-                'correct_answers': 0,
-                'tests_taken': 0,
-                'accuracy': 0.0
+    for period in PERIODS:
+        user_data = _add_to_entry(data[period], user_id, username,
+                                  questions_solved, correct_answers, tests_taken)
+        _check_entry_invariants(period, user_data)
+        _update_rank_index(period, user_key, user_data)
+    
+    _schedule_flush()
+
+def _add_to_entry(table: Dict, user_id: int, username: str, questions_solved: int,
+                  correct_answers: int, tests_taken: int) -> Dict:
+    """Add one update to a user's row of a period table"""
+    user_key = str(user_id)
+    if user_key not in table:
+        table[user_key] = {
+            'user_id': user_id,
+            'username': username,
+            'questions_solved': 0,
+            'correct_answers': 0,
+            'tests_taken': 0,
+            'accuracy': 0.0
+        }
+    
+    user_data = table[user_key]
+    user_data['username'] = username  # Update username
+    user_data['questions_solved'] += questions_solved
+    user_data['correct_answers'] += correct_answers
+    user_data['tests_taken'] += tests_taken
+    
+    # Calculate accuracy
+    if user_data['questions_solved'] > 0:
+        user_data['accuracy'] = round(
+            (user_data['correct_answers'] / user_data['questions_solved']) * 100, 1
+        )
+    
+    return user_data
+
+def _entry_problems(stats: Dict) -> List[str]:
+    """Invariant violations of a single leaderboard row"""
+    problems = []
+    
+    if stats['correct_answers'] > stats['questions_solved']:
+        problems.append('correct_answers > questions_solved')
+    if stats['tests_taken'] > stats['questions_solved']:
+        problems.append('tests_taken > questions_solved')
+    if not 0 <= stats['accuracy'] <= 100:
+        problems.append(f"accuracy {stats['accuracy']}%")
+    
+    return problems
+
+def _check_entry_invariants(period: str, stats: Dict) -> None:
+    """Cheap online consistency check, run on every update"""
+    global _invariant_violations
+    
+    problems = _entry_problems(stats)
+    if problems:
+        _invariant_violations += 1
+        key = (period, str(stats['user_id']))
+        if key not in _invariant_reported:
+            _invariant_reported.add(key)
+            print(f"⚠️ Leaderboard invariant broken for {stats['user_id']} ({period}): {', '.join(problems)}")
+
+def audit_leaderboard() -> Dict[str, int]:
+    """Count inconsistent rows per period"""
+    data = get_leaderboard_data()
+    report = {period: sum(1 for stats in data[period].values() if _entry_problems(stats))
+              for period in PERIODS}
+    report['online_violations'] = _invariant_violations
+    return report
+
+async def rebuild_leaderboard(progress=None, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Recompute all three period tables from user_stats.json in one pass
+    
+    Updates arriving while the rebuild yields are recorded and replayed
+    onto the rebuilt tables before they are swapped in.
+    
+    Args:
+        progress: Optional async callback(done, total) called after each batch
+        batch_size: Users processed between event loop yields
+    
+    Returns:
+        Number of rows per period in the rebuilt tables
+    """
+    global _invariant_violations, _rebuild_deltas
+    from user_stats import load_stats, TEST_HISTORY_LIMIT
+    
+    if _rebuild_deltas is not None:
+        raise RuntimeError("Leaderboard rebuild already running")
+    
+    data = get_leaderboard_data()
+    # Snapshot and delta recording start together (no await in between)
+    stats = load_stats()
+    _rebuild_deltas = []
+    
+    try:
+        period_start = {
+            'weekly': datetime.fromisoformat(data['last_reset']['weekly']),
+            'monthly': datetime.fromisoformat(data['last_reset']['monthly'])
+        }
+        tables = {period: {} for period in PERIODS}
+        # Users whose capped test history may miss tests of the period
+        partial = {'weekly': set(), 'monthly': set()}
+        total_users = len(stats)
+        
+        for done, (user_key, user_stats) in enumerate(stats.items(), 1):
+            old_entry = data['alltime'].get(user_key, {})
+            username = old_entry.get('username', f"User{user_key}")
+            
+            totals = {
+                'alltime': [
+                    user_stats.get('total_questions', 0),
+                    user_stats.get('correct_answers', 0),
+                    user_stats.get('tests_taken', 0)
+                ],
+                'weekly': [0, 0, 0],
+                'monthly': [0, 0, 0]
             }
+            
+            # Period tables come from dated test history (last TEST_HISTORY_LIMIT tests)
+            history = user_stats.get('test_history', [])
+            oldest = None
+            for test in history:
+                try:
+                    test_date = datetime.fromisoformat(test['date'])
+                except (KeyError, ValueError):
+                    continue
+                oldest = test_date if oldest is None else min(oldest, test_date)
+                for period in ('weekly', 'monthly'):
+                    if test_date >= period_start[period]:
+                        totals[period][0] += test.get('total', 0)
+                        totals[period][1] += test.get('score', 0)
+                        totals[period][2] += 1
+            
+            if len(history) >= TEST_HISTORY_LIMIT:
+                for period in ('weekly', 'monthly'):
+                    if oldest is None or oldest >= period_start[period]:
+                        partial[period].add(user_key)
+            
+            for period, (questions, correct, tests) in totals.items():
+                if tests == 0:
+                    continue
+                tables[period][user_key] = {
+                    'user_id': int(user_key),
+                    'username': username,
+                    'questions_solved': questions,
+                    'correct_answers': correct,
+                    'tests_taken': tests,
+                    'accuracy': round((correct / questions) * 100, 1) if questions > 0 else 0.0
+                }
+            
+            if done % batch_size == 0:
+                if progress:
+                    await progress(done, total_users)
+                await asyncio.sleep(0)
         
-        user_data = data[period][user_key]
-        user_data['username'] = username  # Update username
-        user_data['questions_solved'] += questions_solved
-        user_data['correct_answers'] += correct_answers
-        user_data['tests_taken'] += tests_taken
+        # From here on nothing awaits until the tables are swapped in
+        for delta in _rebuild_deltas:
+            for period in PERIODS:
+                _add_to_entry(tables[period], *delta)
         
-        # Calculate accuracy
-        if user_data['questions_solved'] > 0:
-            user_data['accuracy'] = round(
-                (user_data['correct_answers'] / user_data['questions_solved']) * 100, 1
-            )
+        # History can't tell how many tests of the period were trimmed, so
+        # a valid live row counting more tests is kept as it is
+        for period, user_keys in partial.items():
+            for user_key in user_keys:
+                live = data[period].get(user_key)
+                rebuilt = tables[period].get(user_key)
+                if (live is not None and not _entry_problems(live)
+                        and (rebuilt is None or live['tests_taken'] > rebuilt['tests_taken'])):
+                    tables[period][user_key] = live
+        
+        # Swap in rebuilt tables
+        for period in PERIODS:
+            data[period] = tables[period]
+            _rebuild_rank_index(period)
+    finally:
+        _rebuild_deltas = None
+    
+    _invariant_violations = 0
+    _invariant_reported.clear()
+    _schedule_flush()
+    
+    if progress:
+        await progress(total_users, total_users)
+    
+    return {period: len(tables[period]) for period in PERIODS}
+
+def _certificate_kwargs(rank: int, stats: Dict) -> Dict:
+    """Arguments for generate_leaderboard_certificate from a leaderboard row"""
+    return {
+        'rank': rank,
+        'username': stats['username'],
+        'points': stats['points'],
+        'correct': stats['correct_answers'],
+        'total': stats['questions_solved'],
+        'accuracy': stats['accuracy'],
+        'tests_taken': stats['tests_taken'],
+        # An estimated rank is drawn as "TOP N%", never as an exact "#N"
+        'top_percent': stats['top_percent'] if stats.get('rank_approximate') else None
+    }
+
+def _certificate_key(cert_kwargs: Dict) -> str:
+    """Cache key of everything drawn on a rank certificate, including today's date"""
+    return certificate_cache.certificate_key(
+        RANK_TEMPLATE, cert_kwargs, datetime.now().strftime('%d.%m.%Y')
+    )
+
+async def _render_rank_certificate(cert_kwargs: Dict, wait: bool = True) -> BytesIO:
+    """Render rank certificate on the render service"""
+    return await render_service.render(
+        generate_leaderboard_certificate,
+        wait=wait,
+        **cert_kwargs
+    )
+
+async def prerender_rank_certificates(top_n: int = RANK_CERTIFICATE_PRERENDER_TOP_N) -> int:
+    """
+    Render certificates for the all-time top users ahead of time
+    
+    Returns number of certificates rendered
+    """
+    jobs = {}
+    for rank, stats in enumerate(get_leaderboard('alltime', limit=top_n), 1):
+        cert_kwargs = _certificate_kwargs(rank, stats)
+        key = _certificate_key(cert_kwargs)
+        user_key = str(stats['user_id'])
+        
+        if await certificate_cache.run_io(certificate_cache.has, key):
+            continue
+        
+        jobs[user_key] = (key, _render_rank_certificate(cert_kwargs))
+    
+    results = await asyncio.gather(*(job for _, job in jobs.values()), return_exceptions=True)
     
-    save_leaderboard_data(data)
+    rendered = 0
+    for (user_key, (key, _)), certificate in zip(jobs.items(), results):
+        if isinstance(certificate, Exception):
+            print(f"Error pre-rendering rank certificate for {user_key}: {certificate}")
+            continue
+        await certificate_cache.run_io(certificate_cache.put, key, certificate)
+        rendered += 1
+    
+    return rendered
+
+async def _get_rank_certificate(cert_kwargs: Dict) -> Tuple:
+    """
+    Rank certificate, reusing the cached one (or Telegram's copy of it) if still current
+    
+    Returns:
+        (Telegram file_id or image BytesIO, cache key)
+    """
+    key = _certificate_key(cert_kwargs)
+    
+    cached = await certificate_cache.run_io(certificate_cache.get, key)
+    if cached is not None:
+        return cached, key
+    
+    certificate = await _render_rank_certificate(cert_kwargs, wait=False)
+    await certificate_cache.run_io(certificate_cache.put, key, certificate)
+    return certificate, key
 
 async def share_rank_certificate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Generate and send rank certificate"""
@@ -114,29 +528,8 @@ async def share_rank_certificate(update: Update, context: ContextTypes.DEFAULT_T
         )
         return
     
-    # Get username
     try:
-        chat = await context.bot.get_chat(user_id)
-        if chat.username:
-            username = chat.username
-        elif chat.first_name:
-            username = chat.first_name
-        else:
-            username = f"User{user_id}"
-    except:
-        username = f"User{user_id}"
-    
-    # Generate certificate
-    try:
-        certificate = generate_leaderboard_certificate(
-            rank=rank,
-            username=username,
-            points=stats['points'],
-            correct=stats['correct_answers'],
-            total=stats['questions_solved'],
-            accuracy=stats['accuracy'],
-            tests_taken=stats['tests_taken']
-        )
+        cert_kwargs = _certificate_kwargs(rank, stats)
         
         # Rank emoji
         if rank == 1:
@@ -150,17 +543,25 @@ async def share_rank_certificate(update: Update, context: ContextTypes.DEFAULT_T
         
         caption = (
             f"🏆 <b>REYTINGI SERTIFIKATI</b>\n\n"
-            f"{rank_emoji} <b>{rank}-o'rin</b>\n"
+            f"{rank_emoji} <b>{format_rank_text(rank, stats)}</b>\n"
             f"📊 {stats['points']} ball\n\n"
             f"Do'stlaringiz bilan ulashing! 👆"
         )
         
-        await query.message.reply_photo(
-            photo=certificate,
-            caption=caption,
-            parse_mode='HTML'
+        await certificate_cache.send_certificate(
+            lambda certificate: query.message.reply_photo(
+                photo=certificate,
+                caption=caption,
+                parse_mode='HTML'
+            ),
+            lambda: _get_rank_certificate(cert_kwargs)
         )
         
+    except render_service.RenderBusy:
+        await query.message.reply_text(
+            "⏳ Hozir sertifikatlar navbati to'la.\n\n"
+            "Birozdan so'ng qayta urinib ko'ring."
+        )
     except Exception as e:
         print(f"Error generating rank certificate: {e}")
         await query.message.reply_text(
@@ -176,38 +577,29 @@ keyboard = [
 ]
 
 def get_leaderboard(period: str = 'alltime', limit: int = 10) -> List[Dict]:
-    """Get sorted leaderboard for a period"""
-    data = load_leaderboard_data()
-    data = check_and_reset_periods(data)
+    """Get sorted leaderboard for a period (at most LEADERBOARD_EXACT_TOP_K rows)"""
+    data = get_leaderboard_data()
     
-    if period not in data:
+    if period not in _rank_index:
         return []
     
-    # Convert to list and sort by points (weighted ranking)
-    leaderboard = []
-    for user_id, stats in data[period].items():
-        # Calculate ranking points
-        points = calculate_ranking_points(
-            stats['questions_solved'],
-            stats['correct_answers'],
-            stats['tests_taken'],
-            stats['accuracy']
-        )
-        
-        leaderboard.append({
-            'user_id': stats['user_id'],
-            'username': stats['username'],
-            'questions_solved': stats['questions_solved'],
-            'correct_answers': stats['correct_answers'],
-            'tests_taken': stats['tests_taken'],
-            'accuracy': stats['accuracy'],
-            'points': points
-        })
-    
-    # Sort by points (descending)
-    leaderboard.sort(key=lambda x: x['points'], reverse=True)
-    
-    return leaderboard[:limit]
+    # Rank index is already sorted by points (weighted ranking)
+    return [
+        _leaderboard_entry(data[period][user_key], -neg_points)
+        for neg_points, _, user_key in _rank_index[period][:limit]
+    ]
+
+def _leaderboard_entry(stats: Dict, points: int) -> Dict:
+    """Build public leaderboard row"""
+    return {
+        'user_id': stats['user_id'],
+        'username': stats['username'],
+        'questions_solved': stats['questions_solved'],
+        'correct_answers': stats['correct_answers'],
+        'tests_taken': stats['tests_taken'],
+        'accuracy': stats['accuracy'],
+        'points': points
+    }
 
 def calculate_ranking_points(questions: int, correct: int, tests: int, accuracy: float) -> int:
     """
@@ -221,8 +613,6 @@ def calculate_ranking_points(questions: int, correct: int, tests: int, accuracy:
     
     This ensures fair ranking considering both quantity and quality
     """
-    import math
-    
     # Base points from correct answers
     correct_points = correct * 10
     
@@ -240,14 +630,43 @@ def calculate_ranking_points(questions: int, correct: int, tests: int, accuracy:
     return total_points
 
 def get_user_rank(user_id: int, period: str = 'alltime') -> Tuple[int, Dict]:
-    """Get user's rank and stats in leaderboard"""
-    leaderboard = get_leaderboard(period, limit=1000)  # Get full leaderboard
+    """
+    Get user's rank and stats in leaderboard
+    
+    Rank is exact inside the top LEADERBOARD_EXACT_TOP_K. Below that it is
+    estimated from the points sketch and stats['rank_approximate'] is set.
+    stats['top_percent'] is always filled for "TOP 7%" style display.
+    """
+    data = get_leaderboard_data()
+    user_key = str(user_id)
     
-    for rank, user_stats in enumerate(leaderboard, 1):
-        if user_stats['user_id'] == user_id:
-            return rank, user_stats
+    key = _index_keys.get(period, {}).get(user_key)
+    if key is None:
+        return 0, {}
     
-    return 0, {}
+    index = _rank_index[period]
+    total = len(_index_keys[period])
+    entry = (key[0], key[1], user_key)
+    
+    pos = bisect_left(index, entry)
+    if pos < len(index) and index[pos] == entry:
+        rank = pos + 1
+        approximate = False
+    else:
+        estimate = _sketches[period].count_above(-key[0]) + 1
+        rank = min(total, max(len(index) + 1, estimate))
+        approximate = True
+    
+    stats = _leaderboard_entry(data[period][user_key], -key[0])
+    stats['rank_approximate'] = approximate
+    stats['top_percent'] = max(1, math.ceil(rank * 100 / total))
+    return rank, stats
+
+def format_rank_text(rank: int, stats: Dict) -> str:
+    """Format rank as "N-o'rin", or "TOP N%" when only estimated"""
+    if stats.get('rank_approximate'):
+        return f"TOP {stats['top_percent']}%"
+    return f"{rank}-o'rin"
 
 def format_leaderboard_text(period: str, leaderboard: List[Dict], current_user_id: int = None) -> str:
     """Format leaderboard text with emoji medals"""
@@ -345,7 +764,7 @@ async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE, p
         text += (
             f"\n━━━━━━━━━━━━━━━\n\n"
             f"<b>Sizning o'rningiz:</b>\n"
-            f"{rank}. Siz\n"
+            f"{format_rank_text(rank, user_stats)} Siz\n"
             f"   📊 {user_stats['points']} ball | "
             f"✅ {user_stats['correct_answers']}/{user_stats['questions_solved']} | "
             f"🎯 {user_stats['accuracy']}%"
@@ -397,7 +816,7 @@ async def show_my_rank(update: Update, context: ContextTypes.DEFAULT_TYPE):
             elif rank == 3:
                 rank_text = "🥉 3-o'rin"
             else:
-                rank_text = f"{rank}-o'rin"
+                rank_text = format_rank_text(rank, stats)
             
             text += (
                 f"<b>{name}</b>\n"
@@ -432,6 +851,11 @@ __all__ = [
     'show_leaderboard',
     'show_my_rank',
     'update_leaderboard',
+    'flush_leaderboard',
+    'audit_leaderboard',
+    'rebuild_leaderboard',
+    'prerender_rank_certificates',
     'get_user_rank',
+    'format_rank_text',
     'get_leaderboard'
 ]
@@ -5,8 +5,9 @@ Handles Telegram Stars payments, subscriptions, and premium features
 
 from telegram import Update, LabeledPrice, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, PreCheckoutQueryHandler, MessageHandler, filters
-from datetime import datetime, timedelta
-from utils.premium import SubscriptionManager, PremiumTier
+from datetime import datetime
+from utils.premium import SubscriptionManager
+from utils.db import run_db
 
 # Pricing in Telegram Stars
 # 1 Star ≈ $0.01 USD
@@ -21,7 +22,7 @@ async def premium_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Get current subscription status
     is_premium = await SubscriptionManager.is_premium(user_id)
-    sub_info = SubscriptionManager.get_subscription_info(user_id)
+    sub_info = await run_db(SubscriptionManager.get_subscription_info, user_id)
     
     if is_premium:
         # User already has premium
@@ -247,21 +248,21 @@ async def successful_payment_callback(update: Update, context: ContextTypes.DEFA
         payload_parts = payment.invoice_payload.split('_')
         plan_type = payload_parts[0]  # 'monthly' or 'yearly'
         
-        # Calculate subscription dates
-        start_date = datetime.now()
         duration_days = 30 if plan_type == 'monthly' else 365
-        end_date = start_date + timedelta(days=duration_days)
         
-        # Save subscription to database
-        success = SubscriptionManager.save_subscription(
+        # Record payment and extend subscription together (safe to repeat)
+        result = await run_db(
+            SubscriptionManager.process_payment,
+            payment_id=payment.telegram_payment_charge_id,
             user_id=user_id,
-            plan_type=PremiumTier.PREMIUM,
-            start_date=start_date,
-            end_date=end_date,
-            payment_id=payment.telegram_payment_charge_id
+            amount=payment.total_amount,
+            currency=payment.currency,
+            plan_type=plan_type,
+            duration_days=duration_days,
+            payment_provider='telegram_stars'
         )
         
-        if not success:
+        if result is None:
             await update.message.reply_text(
                 "⚠️ <b>Payment Received but Error Occurred</b>\n\n"
                 "Your payment was successful but there was an error activating your subscription. "
@@ -271,15 +272,11 @@ async def successful_payment_callback(update: Update, context: ContextTypes.DEFA
             )
             return
         
-        # Save payment record
-        SubscriptionManager.save_payment(
-            payment_id=payment.telegram_payment_charge_id,
-            user_id=user_id,
-            amount=payment.total_amount,
-            currency=payment.currency,
-            plan_type=plan_type,
-            payment_provider='telegram_stars'
-        )
+        if result['duplicate']:
+            print(f"Duplicate payment delivery ignored: {payment.telegram_payment_charge_id}")
+            return
+        
+        end_date = result['end_date']
         
         # Send success message
         plan_emoji = "📅" if plan_type == 'monthly' else "📆"
@@ -323,7 +320,7 @@ async def view_subscription_callback(update: Update, context: ContextTypes.DEFAU
     await query.answer()
     
     user_id = query.from_user.id
-    sub_info = SubscriptionManager.get_subscription_info(user_id)
+    sub_info = await run_db(SubscriptionManager.get_subscription_info, user_id)
     
     keyboard = [
         [InlineKeyboardButton("« Back", callback_data='premium_menu')]
@@ -374,7 +371,7 @@ async def premium_menu_callback(update: Update, context: ContextTypes.DEFAULT_TY
     
     user_id = query.from_user.id
     is_premium = await SubscriptionManager.is_premium(user_id)
-    sub_info = SubscriptionManager.get_subscription_info(user_id)
+    sub_info = await run_db(SubscriptionManager.get_subscription_info, user_id)
     
     if is_premium:
         keyboard = [
@@ -19,8 +19,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get badges count
     badge_count = 0
     try:
-        from handlers.badges import get_user_badges
-        badges = get_user_badges(user_id)
+        from handlers.badges import fetch_user_badges
+        badges = await fetch_user_badges(user_id)
         badge_count = len(badges)
     except:
         pass
@@ -141,7 +141,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get enhanced stats
     try:
         from user_stats import get_user_summary
-        text = get_user_summary(user_id)
+        text = await get_user_summary(user_id)
     except:
         # Fallback to basic stats
         if stats['total_questions'] > 0:
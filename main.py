@@ -30,6 +30,7 @@ from handlers.admin_tools import (
     handle_search,
     detailed_stats,
     export_questions,
+    rebuild_leaderboard_command,
     admin_state
 )
 from handlers.exam_mode import (
@@ -41,6 +42,10 @@ from handlers.exam_mode import (
     exam_sessions
 )
 from utils.keyboards import get_category_keyboard
+from utils.badge_images import warm_asset_cache
+from utils.daily_usage import load_today
+from utils.migrations import migrate
+from utils import expiry_scheduler
 
 from handlers.leaderboard import (
     leaderboard_command,
@@ -49,6 +54,7 @@ from handlers.leaderboard import (
     share_rank_certificate
 )
 from handlers.badges import (
+    BADGE_DEFINITIONS,
     badges_command,
     show_all_badges,
     show_my_badges
@@ -406,11 +412,25 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text("Hech qanday amal bajarilmayapti.")
 
+async def post_init(application: Application):
+    """Start background tasks once the event loop is running"""
+    expiry_scheduler.start(application.bot)
+
+async def post_shutdown(application: Application):
+    """Stop background tasks"""
+    await expiry_scheduler.stop()
+
 def main():
     """Start the bot"""
 
     # Create application
-    application = Application.builder().token(config.TOKEN).build()
+    application = (
+        Application.builder()
+        .token(config.TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
@@ -425,6 +445,7 @@ def main():
     application.add_handler(CommandHandler("cancel", cancel_command))
     application.add_handler(CommandHandler("leaderboard", leaderboard_command))
     application.add_handler(CommandHandler("badges", badges_command))
+    application.add_handler(CommandHandler("rebuild_leaderboard", rebuild_leaderboard_command))
 
     # Add callback query handler
     application.add_handler(CallbackQueryHandler(handle_callback))
@@ -441,6 +462,15 @@ def main():
     ))
 
     register_premium_handlers(application)
+
+    # Bring the database schema up to date before taking any traffic
+    migrate()
+
+    # Decode certificate templates, fonts and badge titles before the first render
+    warm_asset_cache(badge['name'] for badge in BADGE_DEFINITIONS.values())
+
+    # Restore today's test counters so a restart doesn't reset daily limits
+    load_today()
     
     application.run_polling()
 
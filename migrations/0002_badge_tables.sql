@@ -0,0 +1,13 @@
+-- Earned badges: one bitmask per user (badge ordinal -> bit) plus earn dates
+
+CREATE TABLE IF NOT EXISTS user_badges (
+    user_id INTEGER PRIMARY KEY,
+    badge_mask INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS badge_earned_at (
+    user_id INTEGER NOT NULL,
+    badge_id TEXT NOT NULL,
+    earned_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, badge_id)
+) WITHOUT ROWID;
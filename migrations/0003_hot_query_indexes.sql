@@ -0,0 +1,20 @@
+-- Indexes for the queries run on every update
+
+-- Daily usage by (user_id, date): covered by the UNIQUE(user_id, date)
+-- constraint's index, so the copy made by migrate_premium.py only slowed writes
+DROP INDEX IF EXISTS idx_daily_usage_user_date;
+
+-- subscriptions.user_id is the primary key (the rowid) - a second index on it
+-- is never used
+DROP INDEX IF EXISTS idx_subscriptions_user_id;
+
+-- Payment history per user
+CREATE INDEX IF NOT EXISTS idx_payments_user_id
+    ON payments(user_id);
+
+-- Expiry sweeps: active subscriptions ending before a date. Equality column
+-- first so the end_date range is a single index scan; it also serves
+-- status-only lookups, replacing the old single-column index.
+CREATE INDEX IF NOT EXISTS idx_subscriptions_status_end
+    ON subscriptions(status, end_date);
+DROP INDEX IF EXISTS idx_subscriptions_status;
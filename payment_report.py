@@ -0,0 +1,148 @@
+"""
+Payment reconciliation report
+Revenue per day and plan from the payments table, plus subscriptions and
+payments that don't match up. All aggregation happens in SQLite; rows are
+streamed from the cursor and printed as they arrive.
+
+Payment dates are stored by SQLite's CURRENT_TIMESTAMP, so days are UTC.
+
+Usage:
+  python payment_report.py                          - Full report
+  python payment_report.py --since 2025-01-01       - Payments from a date on
+  python payment_report.py --since 2025-01-01 --until 2025-01-31
+"""
+
+import argparse
+import sqlite3
+import sys
+
+from settings import DB_PATH
+
+# Test subscriptions created by migrate_premium.py have no payment behind them
+TEST_PAYMENT_ID = 'TEST_PAYMENT'
+
+
+def _date_filter(since, until):
+    """WHERE clause fragment and params limiting payments to a date range"""
+    clauses = ["status = 'completed'"]
+    params = []
+    if since:
+        clauses.append("date(payment_date) >= ?")
+        params.append(since)
+    if until:
+        clauses.append("date(payment_date) <= ?")
+        params.append(until)
+    return " AND ".join(clauses), params
+
+
+def revenue_by_day(conn, since=None, until=None) -> None:
+    where, params = _date_filter(since, until)
+
+    print("\n💰 Revenue per day and plan")
+    print(f"   {'day':<12} {'plan':<10} {'currency':<9} {'payments':>9} {'amount':>12}")
+
+    rows = conn.execute(f"""
+        SELECT date(payment_date) AS day, plan_type, currency,
+               COUNT(*), SUM(amount)
+        FROM payments
+        WHERE {where}
+        GROUP BY day, plan_type, currency
+        ORDER BY day, plan_type, currency
+    """, params)
+
+    empty = True
+    for day, plan_type, currency, count, total in rows:
+        empty = False
+        print(f"   {day:<12} {plan_type:<10} {currency:<9} {count:>9} {total:>12.2f}")
+    if empty:
+        print("   (no payments)")
+
+    print("\n📊 Totals per plan")
+    rows = conn.execute(f"""
+        SELECT plan_type, currency, COUNT(*), SUM(amount),
+               MIN(date(payment_date)), MAX(date(payment_date))
+        FROM payments
+        WHERE {where}
+        GROUP BY plan_type, currency
+        ORDER BY plan_type, currency
+    """, params)
+    for plan_type, currency, count, total, first, last in rows:
+        print(f"   {plan_type:<10} {currency:<9} {count:>9} {total:>12.2f}   ({first} .. {last})")
+
+
+def orphaned_subscriptions(conn) -> int:
+    """Premium subscriptions whose payment isn't in the ledger"""
+    print("\n🔍 Premium subscriptions without a matching payment")
+
+    rows = conn.execute("""
+        SELECT s.user_id, s.payment_id, s.end_date, s.status
+        FROM subscriptions s
+        LEFT JOIN payments p ON p.payment_id = s.payment_id
+        WHERE s.plan_type != 'free'
+          AND p.payment_id IS NULL
+        ORDER BY s.end_date
+    """)
+
+    found = 0
+    for user_id, payment_id, end_date, status in rows:
+        found += 1
+        note = " (test)" if payment_id == TEST_PAYMENT_ID else ""
+        print(f"   user {user_id}: payment {payment_id or '-'}{note}, {status} until {end_date}")
+    if not found:
+        print("   ✅ None")
+    return found
+
+
+def mismatched_payments(conn) -> int:
+    """Payments made by a user with no subscription, or paying for someone else's"""
+    print("\n🔍 Payments not matching a subscription")
+
+    # A subscription only references its latest payment, so earlier payments
+    # of the same user are expected to be unreferenced
+    rows = conn.execute("""
+        SELECT p.payment_id, p.user_id, p.amount, p.currency, date(p.payment_date),
+               'user has no subscription'
+        FROM payments p
+        WHERE p.status = 'completed'
+          AND NOT EXISTS (SELECT 1 FROM subscriptions s WHERE s.user_id = p.user_id)
+        UNION ALL
+        SELECT p.payment_id, p.user_id, p.amount, p.currency, date(p.payment_date),
+               'subscription belongs to user ' || s.user_id
+        FROM payments p
+        JOIN subscriptions s ON s.payment_id = p.payment_id
+        WHERE s.user_id != p.user_id
+    """)
+
+    found = 0
+    for payment_id, user_id, amount, currency, day, problem in rows:
+        found += 1
+        print(f"   {payment_id} ({day}, user {user_id}, {amount:g} {currency}): {problem}")
+    if not found:
+        print("   ✅ None")
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Payment reconciliation report")
+    parser.add_argument('--since', help="first payment day (YYYY-MM-DD, UTC)")
+    parser.add_argument('--until', help="last payment day (YYYY-MM-DD, UTC)")
+    args = parser.parse_args()
+
+    try:
+        conn = sqlite3.connect(f'file:{DB_PATH}?mode=ro', uri=True)
+    except sqlite3.Error as e:
+        print(f"❌ Cannot open database {DB_PATH}: {e}")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("PPD Bot - Payment Reconciliation")
+    print("=" * 60)
+
+    revenue_by_day(conn, args.since, args.until)
+    problems = orphaned_subscriptions(conn) + mismatched_payments(conn)
+    conn.close()
+
+    if problems:
+        print(f"\n⚠️ {problems} record(s) need attention")
+        sys.exit(1)
+    print("\n✅ Ledger and subscriptions match")
@@ -0,0 +1,33 @@
+"""
+Storage and rendering settings
+Everything here can be imported without bot credentials, so offline tools
+(migrations, reports, backfills, benchmarks) run without BOT_TOKEN/ADMIN_ID.
+config.py re-exports these for the bot.
+"""
+
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# SQLite storage - read once at startup by utils/db.py
+DB_PATH = os.getenv("DB_PATH", "ppd_bot.db")
+# WAL lets readers run while a write is in progress
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL").upper()
+# Page cache per connection, in KiB
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "16384"))
+# Bytes of the database file memory-mapped for reads (0 disables)
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Certificate image encoding (profiles are defined in utils/badge_images.py).
+# Profiles are tried in order; the first one whose output fits the byte budget is sent.
+CERTIFICATE_BYTE_BUDGET = int(os.getenv("CERTIFICATE_BYTE_BUDGET", "250000"))
+CERTIFICATE_ENCODER_LADDER = os.getenv(
+    "CERTIFICATE_ENCODER_LADDER",
+    "jpeg_q90,jpeg_q85,jpeg_q75,jpeg_q75_progressive,jpeg_q60_progressive,webp_q75"
+).split(",")
+
+# Validate settings
+if DB_JOURNAL_MODE not in ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'):
+    raise ValueError(f"Invalid DB_JOURNAL_MODE: {DB_JOURNAL_MODE}")
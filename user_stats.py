@@ -7,6 +7,8 @@ from typing import Dict, List, Set
 from datetime import datetime, date
 
 STATS_FILE = 'user_stats.json'
+# Tests kept per user in test_history
+TEST_HISTORY_LIMIT = 20
 
 def load_stats() -> Dict:
     """Load user statistics"""
@@ -95,6 +97,20 @@ def record_answer(user_id: int, question_id: int, is_correct: bool, category: st
 
 async def record_test_completion(user_id: int, category: str, score: int, total: int, context=None) -> None:
     """Record completed test and update leaderboard/badges"""
+    # Look the username up first: from load_stats() to update_leaderboard()
+    # nothing may await, or a concurrent test or leaderboard rebuild could
+    # see the stats file and the leaderboard disagree
+    username = f"User{user_id}"  # Default
+    if context and hasattr(context, 'bot'):
+        try:
+            chat = await context.bot.get_chat(user_id)
+            if chat.username:
+                username = f"@{chat.username}"
+            elif chat.first_name:
+                username = chat.first_name
+        except:
+            pass
+    
     stats = load_stats()
     user_key = str(user_id)
     
@@ -157,33 +173,20 @@ async def record_test_completion(user_id: int, category: str, score: int, total:
         'percentage': round(percentage, 1)
     })
     
-    # Keep only last 20 tests
-    if len(user_stats['test_history']) > 20:
-        user_stats['test_history'] = user_stats['test_history'][-20:]
+    # Keep only last TEST_HISTORY_LIMIT tests
+    if len(user_stats['test_history']) > TEST_HISTORY_LIMIT:
+        user_stats['test_history'] = user_stats['test_history'][-TEST_HISTORY_LIMIT:]
     
     save_stats(stats)
     
     # Update leaderboard
     try:
         from handlers.leaderboard import update_leaderboard
-        from telegram import Update
-        
-        # Get username
-        username = f"User{user_id}"  # Default
-        if context and hasattr(context, 'bot'):
-            try:
-                chat = await context.bot.get_chat(user_id)
-                if chat.username:
-                    username = f"@{chat.username}"
-                elif chat.first_name:
-                    username = chat.first_name
-            except:
-                pass
         
         update_leaderboard(
             user_id=user_id,
             username=username,
-            questions_solved=1,  # Incremental
+            questions_solved=total,  # Incremental
             correct_answers=score,
             tests_taken=1
         )
@@ -192,7 +195,8 @@ async def record_test_completion(user_id: int, category: str, score: int, total:
     
     # Check and award badges
     try:
-        from handlers.badges import check_and_award_badges, notify_new_badge
+        from handlers.badges import check_and_award_badges
+        from handlers.badge_notifications import enqueue_badge_notifications
         from handlers.leaderboard import get_user_rank
         
         # Add rank info for legend badge
@@ -200,12 +204,11 @@ async def record_test_completion(user_id: int, category: str, score: int, total:
         user_stats['top_rank'] = rank if rank > 0 else 999
         
         # Check badges
-        newly_earned = check_and_award_badges(user_id, user_stats)
+        newly_earned = await check_and_award_badges(user_id, user_stats)
         
-        # Notify user of new badges
+        # Notify user of new badges in the background
         if newly_earned and context:
-            for badge_id in newly_earned:
-                await notify_new_badge(context, user_id, badge_id)
+            enqueue_badge_notifications(context, user_id, newly_earned)
     except Exception as e:
         print(f"Error checking badges: {e}")
 
@@ -224,14 +227,14 @@ def get_wrong_questions(user_id: int) -> List[int]:
     user_stats = get_user_stats(user_id)
     return user_stats.get('wrong_questions', [])
 
-def get_user_summary(user_id: int) -> str:
+async def get_user_summary(user_id: int) -> str:
     """Get formatted user summary with badges and rank"""
     stats = get_user_stats(user_id)
     
     # Get badges
     try:
-        from handlers.badges import get_user_badges
-        badges = get_user_badges(user_id)
+        from handlers.badges import fetch_user_badges
+        badges = await fetch_user_badges(user_id)
         badge_text = " ".join([b['emoji'] for b in badges[:5]])  # Show first 5 badges
         if len(badges) > 5:
             badge_text += f" +{len(badges) - 5}"
@@ -240,13 +243,13 @@ def get_user_summary(user_id: int) -> str:
     
     # Get rank
     try:
-        from handlers.leaderboard import get_user_rank
-        rank, _ = get_user_rank(user_id, 'alltime')
+        from handlers.leaderboard import get_user_rank, format_rank_text
+        rank, rank_stats = get_user_rank(user_id, 'alltime')
         if rank > 0 and rank <= 3:
             rank_medals = ['🥇', '🥈', '🥉']
             rank_text = f"\n🏆 Reyting: {rank_medals[rank-1]} {rank}-o'rin"
         elif rank > 0:
-            rank_text = f"\n🏆 Reyting: {rank}-o'rin"
+            rank_text = f"\n🏆 Reyting: {format_rank_text(rank, rank_stats)}"
         else:
             rank_text = ""
     except:
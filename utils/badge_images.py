@@ -5,12 +5,209 @@ PROFESSIONAL Badge Certificate Generator - Uses your beautiful badge templates!
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
 from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+import threading
+import time
 import os
 
+from settings import CERTIFICATE_BYTE_BUDGET, CERTIFICATE_ENCODER_LADDER
+
 # Get the script directory for asset paths
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ASSETS_DIR = os.path.join(SCRIPT_DIR, 'assets')
 
+FONT_BOLD = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+FONT_REGULAR = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+BADGE_TEMPLATE = 'badge_template_2.png'
+RANK_TEMPLATE = 'badge_template_1.png'
+
+# Badge titles kept pre-drawn (covers every badge in BADGE_DEFINITIONS)
+BADGE_TITLE_CACHE_SIZE = 64
+
+# Encoder settings by name. Plain baseline JPEG is by far the fastest to
+# encode; optimize/progressive and WebP trade encode time for smaller files.
+ENCODER_PROFILES = {
+    'jpeg_q95': {'format': 'JPEG', 'quality': 95},
+    'jpeg_q90': {'format': 'JPEG', 'quality': 90},
+    'jpeg_q85': {'format': 'JPEG', 'quality': 85},
+    'jpeg_q75': {'format': 'JPEG', 'quality': 75},
+    'jpeg_q75_progressive': {'format': 'JPEG', 'quality': 75, 'optimize': True, 'progressive': True},
+    'jpeg_q60_progressive': {'format': 'JPEG', 'quality': 60, 'optimize': True, 'progressive': True},
+    'webp_q75': {'format': 'WEBP', 'quality': 75, 'method': 0}
+}
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+# profile -> {'count', 'seconds', 'bytes', 'over_budget'}
+_encoder_stats: Dict[str, Dict] = {}
+_encoder_stats_lock = threading.Lock()
+
+# (font path, size) pairs used by the generators below
+CERTIFICATE_FONTS = (
+    (FONT_BOLD, 60), (FONT_BOLD, 45), (FONT_REGULAR, 35),
+    (FONT_BOLD, 80), (FONT_BOLD, 55), (FONT_REGULAR, 40), (FONT_REGULAR, 32),
+    (FONT_BOLD, 100), (FONT_BOLD, 70), (FONT_REGULAR, 50),
+    (FONT_BOLD, 150)
+)
+
+
+# ==================== ASSET CACHE ====================
+
+@lru_cache(maxsize=None)
+def get_font(path: str, size: int):
+    """Load a TrueType font once per (path, size), default font if unavailable"""
+    try:
+        return ImageFont.truetype(path, size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=None)
+def _decoded_template(name: str) -> Optional[Image.Image]:
+    template_path = os.path.join(ASSETS_DIR, name)
+    if not os.path.exists(template_path):
+        print(f"⚠️ Template not found at {template_path}, using fallback")
+        return None
+
+    # Composite onto white once - certificates are sent as JPEG (better for Telegram)
+    img = Image.open(template_path).convert('RGBA')
+    rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+    rgb_img.paste(img, mask=img.split()[3])
+    return rgb_img
+
+
+def get_template(name: str) -> Optional[Image.Image]:
+    """
+    Decoded RGB template, ready to draw on
+
+    The template is read, decoded and flattened once; every call gets its
+    own copy. Returns None if the template file is missing.
+    """
+    img = _decoded_template(name)
+    return img.copy() if img is not None else None
+
+
+@lru_cache(maxsize=BADGE_TITLE_CACHE_SIZE)
+def _badge_title_layer(badge_name: str) -> Optional[Tuple[Tuple[int, int], Image.Image]]:
+    """
+    Badge template strip with the badge title already drawn
+
+    Only the title's bounding box is kept, so every badge costs a few
+    hundred KB instead of a full template.
+
+    Returns:
+        (top-left position, RGB strip), or None if the template is missing
+    """
+    img = get_template(BADGE_TEMPLATE)
+    if img is None:
+        return None
+
+    width, height = img.size
+    title_args = dict(
+        xy=(width // 2, int(height * 0.70)),
+        text=badge_name.upper(),
+        anchor='mm',
+        font=get_font(FONT_BOLD, 60),
+        stroke_width=2
+    )
+
+    draw = ImageDraw.Draw(img)
+    draw.text(fill='white', stroke_fill='#000033', **title_args)  # Outline for readability
+
+    left, top, right, bottom = draw.textbbox(**title_args)
+    box = (max(0, left), max(0, top), min(width, right), min(height, bottom))
+    return box[:2], img.crop(box)
+
+
+def warm_asset_cache(badge_names: Iterable[str] = ()) -> None:
+    """Load templates, fonts and badge title layers up front (call at startup)"""
+    _decoded_template(BADGE_TEMPLATE)
+    _decoded_template(RANK_TEMPLATE)
+    for path, size in CERTIFICATE_FONTS:
+        get_font(path, size)
+    for badge_name in badge_names:
+        _badge_title_layer(badge_name)
+
+
+def clear_asset_cache() -> None:
+    """Drop cached templates, fonts and title layers (e.g. after replacing assets)"""
+    _decoded_template.cache_clear()
+    _badge_title_layer.cache_clear()
+    get_font.cache_clear()
+
+
+def encode_certificate(img: Image.Image, name: str) -> BytesIO:
+    """
+    Encode a certificate with the first ladder profile that fits the byte budget
+
+    If no profile fits, the smallest output is used.
+
+    Args:
+        img: RGB certificate image
+        name: File name without extension
+
+    Returns:
+        Encoded image, rewound, with .name set
+    """
+    ladder = [p for p in CERTIFICATE_ENCODER_LADDER if p in ENCODER_PROFILES] or ['jpeg_q95']
+    best = None
+    best_profile = None
+
+    for profile_name in ladder:
+        profile = ENCODER_PROFILES[profile_name]
+        output = BytesIO()
+        started = time.perf_counter()
+        img.save(output, **profile)
+        elapsed = time.perf_counter() - started
+
+        size = output.tell()
+        fits = size <= CERTIFICATE_BYTE_BUDGET
+        _record_encode(profile_name, elapsed, size, fits)
+
+        if fits or best is None or size < best.tell():
+            best, best_profile = output, profile
+        if fits:
+            break
+
+    best.seek(0)
+    best.name = f"{name}.{FORMAT_EXTENSIONS[best_profile['format']]}"
+    return best
+
+
+def _record_encode(profile_name: str, seconds: float, size: int, fits: bool) -> None:
+    with _encoder_stats_lock:
+        stats = _encoder_stats.setdefault(
+            profile_name, {'count': 0, 'seconds': 0.0, 'bytes': 0, 'over_budget': 0}
+        )
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        stats['bytes'] += size
+        if not fits:
+            stats['over_budget'] += 1
+
+
+def get_encoder_stats() -> Dict[str, Dict]:
+    """Encode count, average time (ms), average size (bytes) and misses per profile"""
+    with _encoder_stats_lock:
+        return {
+            profile_name: {
+                'count': stats['count'],
+                'avg_ms': round(stats['seconds'] / stats['count'] * 1000, 1),
+                'avg_bytes': stats['bytes'] // stats['count'],
+                'over_budget': stats['over_budget']
+            }
+            for profile_name, stats in _encoder_stats.items()
+        }
+
+
+def reset_encoder_stats() -> None:
+    """Forget collected encoder metrics"""
+    with _encoder_stats_lock:
+        _encoder_stats.clear()
+
+
 def generate_badge_certificate(badge_name: str, badge_emoji: str, username: str, date_earned: str) -> BytesIO:
     """
     Generate certificate using professional badge template
@@ -18,28 +215,23 @@ def generate_badge_certificate(badge_name: str, badge_emoji: str, username: str,
     """
     
     try:
-        # Load your badge template
-        template_path = os.path.join(ASSETS_DIR, 'badge_template_2.png')
+        # Your badge template (decoded once, copied per certificate)
+        img = get_template(BADGE_TEMPLATE)
+        title_layer = _badge_title_layer(badge_name)
         
-        if not os.path.exists(template_path):
-            print(f"⚠️ Template not found at {template_path}, using fallback")
+        if img is None or title_layer is None:
             return generate_simple_fallback(badge_name, badge_emoji, username, date_earned)
         
-        # Open template image
-        img = Image.open(template_path).convert('RGBA')
+        # Badge name (main text) - middle area, pre-drawn once per badge
+        position, title_strip = title_layer
+        img.paste(title_strip, position)
         
         # Create drawing context
         draw = ImageDraw.Draw(img)
         
-        # Load fonts
-        try:
-            large_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 60)
-            medium_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 45)
-            small_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 35)
-        except:
-            large_font = ImageFont.load_default()
-            medium_font = ImageFont.load_default()
-            small_font = ImageFont.load_default()
+        # Fonts
+        medium_font = get_font(FONT_BOLD, 45)
+        small_font = get_font(FONT_REGULAR, 35)
         
         # Get image dimensions
         width, height = img.size
@@ -47,18 +239,6 @@ def generate_badge_certificate(badge_name: str, badge_emoji: str, username: str,
         # Overlay text in center-bottom area (below the badge graphic)
         # These positions work well with your badge design
         
-        # Badge name (main text) - middle area
-        badge_text = badge_name.upper()
-        draw.text(
-            (width // 2, int(height * 0.70)), 
-            badge_text, 
-            fill='white', 
-            anchor='mm', 
-            font=large_font,
-            stroke_width=2,
-            stroke_fill='#000033'  # Outline for readability
-        )
-        
         # Username - below badge name
         username_display = username if username.startswith('@') else f"@{username}"
         draw.text(
@@ -80,57 +260,49 @@ def generate_badge_certificate(badge_name: str, badge_emoji: str, username: str,
             font=small_font
         )
         
-        # Convert to RGB for JPEG (better for Telegram)
-        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-        rgb_img.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
-        
-        # Save to BytesIO
-        output = BytesIO()
-        rgb_img.save(output, format='JPEG', quality=95, optimize=True)
-        output.seek(0)
-        output.name = f'badge_{badge_name.replace(" ", "_")}.jpg'
-        
-        return output
+        # Encode within the byte budget (template is already RGB)
+        return encode_certificate(img, f'badge_{badge_name.replace(" ", "_")}')
         
     except Exception as e:
         print(f"❌ Error using template: {e}")
         return generate_simple_fallback(badge_name, badge_emoji, username, date_earned)
 
 
+def rank_label(rank: int, top_percent: int = None) -> str:
+    """Rank as drawn on a certificate: medal, "#N", or "TOP N%" if only estimated"""
+    if top_percent is not None:
+        return f"TOP {top_percent}%"
+    return f"#{rank}" if rank > 3 else ['🥇', '🥈', '🥉'][rank-1]
+
+
 def generate_leaderboard_certificate(rank: int, username: str, points: int, 
                                      correct: int, total: int, accuracy: float, 
-                                     tests_taken: int) -> BytesIO:
+                                     tests_taken: int, top_percent: int = None) -> BytesIO:
     """
     Generate leaderboard rank certificate using template
+    
+    top_percent is drawn instead of the rank when the rank is only estimated
     """
     
     try:
         # Use template 1 for leaderboard (with TOP 10)
-        template_path = os.path.join(ASSETS_DIR, 'badge_template_1.png')
+        img = get_template(RANK_TEMPLATE)
         
-        if not os.path.exists(template_path):
-            print(f"⚠️ Template not found, using fallback")
-            return generate_rank_fallback(rank, username, points, correct, total, accuracy, tests_taken)
+        if img is None:
+            return generate_rank_fallback(rank, username, points, correct, total, accuracy, tests_taken, top_percent)
         
-        img = Image.open(template_path).convert('RGBA')
         draw = ImageDraw.Draw(img)
         
         # Fonts
-        try:
-            huge_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 80)
-            large_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 55)
-            medium_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 40)
-            small_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 32)
-        except:
-            huge_font = ImageFont.load_default()
-            large_font = ImageFont.load_default()
-            medium_font = ImageFont.load_default()
-            small_font = ImageFont.load_default()
+        huge_font = get_font(FONT_BOLD, 80)
+        large_font = get_font(FONT_BOLD, 55)
+        medium_font = get_font(FONT_REGULAR, 40)
+        small_font = get_font(FONT_REGULAR, 32)
         
         width, height = img.size
         
         # Rank number (big, in center)
-        rank_text = f"#{rank}" if rank > 3 else ['🥇', '🥈', '🥉'][rank-1]
+        rank_text = rank_label(rank, top_percent)
         draw.text(
             (width // 2, int(height * 0.40)), 
             rank_text, 
@@ -183,20 +355,12 @@ def generate_leaderboard_certificate(rank: int, username: str, points: int,
             font=small_font
         )
         
-        # Convert to RGB
-        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-        rgb_img.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
-        
-        output = BytesIO()
-        rgb_img.save(output, format='JPEG', quality=95, optimize=True)
-        output.seek(0)
-        output.name = f'rank_{rank}_certificate.jpg'
-        
-        return output
+        # Encode within the byte budget (template is already RGB)
+        return encode_certificate(img, f'rank_{rank}_certificate')
         
     except Exception as e:
         print(f"❌ Error: {e}")
-        return generate_rank_fallback(rank, username, points, correct, total, accuracy, tests_taken)
+        return generate_rank_fallback(rank, username, points, correct, total, accuracy, tests_taken, top_percent)
 
 
 def generate_simple_fallback(badge_name: str, badge_emoji: str, username: str, date_earned: str) -> BytesIO:
@@ -216,14 +380,9 @@ def generate_simple_fallback(badge_name: str, badge_emoji: str, username: str, d
     # Gold border
     draw.rectangle([(40, 40), (width - 40, height - 40)], outline='#FFD700', width=12)
     
-    try:
-        large_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 100)
-        medium_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 70)
-        small_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 50)
-    except:
-        large_font = ImageFont.load_default()
-        medium_font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
+    large_font = get_font(FONT_BOLD, 100)
+    medium_font = get_font(FONT_BOLD, 70)
+    small_font = get_font(FONT_REGULAR, 50)
     
     # Text
     draw.text((width // 2, 300), badge_emoji * 3, fill='white', anchor='mm', font=large_font)
@@ -231,15 +390,12 @@ def generate_simple_fallback(badge_name: str, badge_emoji: str, username: str, d
     draw.text((width // 2, 650), f"@{username}", fill='white', anchor='mm', font=small_font)
     draw.text((width // 2, 800), date_earned, fill='#CCCCCC', anchor='mm', font=small_font)
     
-    output = BytesIO()
-    img.save(output, format='JPEG', quality=95)
-    output.seek(0)
-    return output
+    return encode_certificate(img, 'certificate')
 
 
 def generate_rank_fallback(rank: int, username: str, points: int, 
                            correct: int, total: int, accuracy: float, 
-                           tests_taken: int) -> BytesIO:
+                           tests_taken: int, top_percent: int = None) -> BytesIO:
     """Fallback for rank certificates"""
     width, height = 1080, 1080
     img = Image.new('RGB', (width, height), color='#1a1a3e')
@@ -256,17 +412,12 @@ def generate_rank_fallback(rank: int, username: str, points: int,
     border_color = '#FFD700' if rank <= 3 else '#4a4a6a'
     draw.rectangle([(40, 40), (width - 40, height - 40)], outline=border_color, width=12)
     
-    try:
-        huge_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 150)
-        large_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 80)
-        medium_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 50)
-    except:
-        huge_font = ImageFont.load_default()
-        large_font = ImageFont.load_default()
-        medium_font = ImageFont.load_default()
+    huge_font = get_font(FONT_BOLD, 150)
+    large_font = get_font(FONT_BOLD, 80)
+    medium_font = get_font(FONT_REGULAR, 50)
     
     # Rank
-    rank_text = f"#{rank}" if rank > 3 else ['🥇', '🥈', '🥉'][rank-1]
+    rank_text = rank_label(rank, top_percent)
     draw.text((width // 2, 300), rank_text, fill='#FFD700', anchor='mm', font=huge_font)
     
     # Username
@@ -276,7 +427,4 @@ def generate_rank_fallback(rank: int, username: str, points: int,
     draw.text((width // 2, 650), f"{points} BALL", fill='#FFD700', anchor='mm', font=medium_font)
     draw.text((width // 2, 750), f"✅ {correct}/{total}  •  🎯 {accuracy}%", fill='white', anchor='mm', font=medium_font)
     
-    output = BytesIO()
-    img.save(output, format='JPEG', quality=95)
-    output.seek(0)
-    return output
+    return encode_certificate(img, 'certificate')
@@ -0,0 +1,206 @@
+"""
+Badge requirement rules
+Requirement strings are parsed once into structured conditions and
+compiled into plain callables - no eval on the hot path
+"""
+
+import operator
+from typing import Callable, Dict, List, NamedTuple, Union
+
+# Badge metric -> (user stats key, default value)
+BADGE_METRICS = {
+    'questions_solved': ('total_questions', 0),
+    'correct_answers': ('correct_answers', 0),
+    'tests_taken': ('tests_taken', 0),
+    'accuracy': ('accuracy', 0),
+    'perfect_scores': ('perfect_scores', 0),
+    'exams_passed': ('exams_passed', 0),
+    'daily_streak': ('daily_streak', 0),
+    'tests_in_day': ('tests_in_day', 0),
+    'night_tests': ('night_tests', 0),
+    'early_tests': ('early_tests', 0),
+    'wrong_questions_corrected': ('wrong_questions_corrected', 0),
+    'top_rank': ('top_rank', 999)
+}
+
+OPERATORS = {
+    '>=': operator.ge,
+    '>': operator.gt,
+    '<=': operator.le,
+    '<': operator.lt,
+    '==': operator.eq
+}
+
+Number = Union[int, float]
+
+
+class Condition(NamedTuple):
+    """Single `metric op threshold` comparison"""
+    metric: str
+    op: str
+    threshold: Number
+
+
+def _parse_number(text: str) -> Number:
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_requirement(requirement: str) -> List[Condition]:
+    """
+    Parse requirement string into conditions joined by 'and'
+
+    Args:
+        requirement: e.g. 'accuracy >= 90 and questions_solved >= 100'
+
+    Returns:
+        List of conditions that must all hold
+
+    Raises:
+        ValueError: If the requirement uses unknown syntax or metrics
+    """
+    conditions = []
+
+    for clause in requirement.split(' and '):
+        parts = clause.split()
+        if len(parts) != 3 or parts[1] not in OPERATORS:
+            raise ValueError(f"Unsupported badge requirement: {requirement!r}")
+
+        metric, op, threshold = parts
+        if metric not in BADGE_METRICS:
+            raise ValueError(f"Unknown badge metric {metric!r} in {requirement!r}")
+
+        try:
+            conditions.append(Condition(metric, op, _parse_number(threshold)))
+        except ValueError:
+            raise ValueError(f"Invalid threshold {threshold!r} in {requirement!r}")
+
+    return conditions
+
+
+def compile_rule(conditions: List[Condition]) -> Callable[[Dict], bool]:
+    """Compile conditions into a predicate over a badge context"""
+    checks = tuple((c.metric, OPERATORS[c.op], c.threshold) for c in conditions)
+
+    if len(checks) == 1:
+        metric, compare, threshold = checks[0]
+        return lambda context: compare(context[metric], threshold)
+
+    def predicate(context: Dict) -> bool:
+        for metric, compare, threshold in checks:
+            if not compare(context[metric], threshold):
+                return False
+        return True
+
+    return predicate
+
+
+def build_badge_context(user_stats: Dict) -> Dict[str, Number]:
+    """Badge metric values for a user (built once per check)"""
+    return {
+        metric: user_stats.get(key, default)
+        for metric, (key, default) in BADGE_METRICS.items()
+    }
+
+
+def build_dependency_index(rules: Dict[str, List[Condition]]) -> Dict[str, List[str]]:
+    """Map each metric to the badges whose requirement reads it"""
+    index: Dict[str, List[str]] = {}
+    for badge_id, conditions in rules.items():
+        for metric in dict.fromkeys(c.metric for c in conditions):
+            index.setdefault(metric, []).append(badge_id)
+    return index
+
+
+def next_thresholds(rules: Dict[str, List[Condition]], earned, context: Dict) -> Dict[str, List[Condition]]:
+    """
+    Next unmet threshold per metric among unearned badges
+
+    Each unearned badge is watched on one condition it doesn't meet yet -
+    the badge cannot unlock before that condition holds. Watched
+    thresholds are widened to inclusive bounds (the lowest '>='/'>' and
+    highest '<='/'<' per metric), so while a metric stays on the wrong
+    side of its bound no badge watching it can unlock.
+    """
+    lower: Dict[str, Number] = {}
+    upper: Dict[str, Number] = {}
+    exact: Dict[str, List[Condition]] = {}
+
+    for badge_id, conditions in rules.items():
+        if badge_id in earned or not conditions:
+            continue
+
+        watched = conditions[0]
+        for c in conditions:
+            if not OPERATORS[c.op](context[c.metric], c.threshold):
+                watched = c
+                break
+
+        c = watched
+        if c.op in ('>=', '>'):
+            lower[c.metric] = min(lower.get(c.metric, c.threshold), c.threshold)
+        elif c.op in ('<=', '<'):
+            upper[c.metric] = max(upper.get(c.metric, c.threshold), c.threshold)
+        else:
+            exact.setdefault(c.metric, []).append(c)
+
+    gates: Dict[str, List[Condition]] = {}
+    for metric, threshold in lower.items():
+        gates.setdefault(metric, []).append(Condition(metric, '>=', threshold))
+    for metric, threshold in upper.items():
+        gates.setdefault(metric, []).append(Condition(metric, '<=', threshold))
+    for metric, conditions in exact.items():
+        gates.setdefault(metric, []).extend(conditions)
+
+    return gates
+
+
+def gate_open(gates: List[Condition], value: Number) -> bool:
+    """True if value reaches any of the metric's next thresholds"""
+    for c in gates:
+        if OPERATORS[c.op](value, c.threshold):
+            return True
+    return False
+
+
+def condition_progress(condition: Condition, value: Number) -> float:
+    """How close value is to meeting a condition (0.0 - 1.0)"""
+    compare = OPERATORS[condition.op]
+    if compare(value, condition.threshold):
+        return 1.0
+
+    threshold = condition.threshold
+    if condition.op in ('>=', '>'):
+        return max(0.0, value / threshold) if threshold > 0 else 0.0
+    if condition.op in ('<=', '<'):
+        return min(1.0, threshold / value) if value > 0 else 0.0
+    return 0.0
+
+
+def rule_progress(conditions: List[Condition], context: Dict) -> Dict:
+    """
+    Progress towards a compound rule
+
+    The least complete condition decides the overall progress.
+
+    Returns:
+        Dict with bottleneck 'metric', its 'current' and 'target' values
+        and overall 'progress' (0.0 - 1.0)
+    """
+    bottleneck = None
+    lowest = 1.0
+
+    for c in conditions:
+        progress = condition_progress(c, context[c.metric])
+        if bottleneck is None or progress < lowest:
+            bottleneck = c
+            lowest = progress
+
+    return {
+        'metric': bottleneck.metric,
+        'current': context[bottleneck.metric],
+        'target': bottleneck.threshold,
+        'progress': min(1.0, lowest)
+    }
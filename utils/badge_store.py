@@ -0,0 +1,126 @@
+"""
+Badge storage in SQLite
+Earned badges are kept per user as an integer bitmask (badge ordinal -> bit)
+plus a table of earn dates
+"""
+
+from typing import Dict, Iterator, Tuple
+import sqlite3
+
+from utils.db import get_connection
+from utils.migrations import migrate
+
+_schema_ready = False
+
+
+def _connect() -> sqlite3.Connection:
+    global _schema_ready
+    conn = get_connection()
+
+    # Scripts using the store directly don't go through main's startup
+    if not _schema_ready:
+        migrate(conn)
+        _schema_ready = True
+
+    return conn
+
+
+def is_empty() -> bool:
+    """True if no badges have been stored yet"""
+    try:
+        conn = _connect()
+        row = conn.execute("SELECT 1 FROM user_badges LIMIT 1").fetchone()
+        return row is None
+    except sqlite3.Error as e:
+        print(f"Database error in badge_store.is_empty: {e}")
+        return False
+
+
+def get_badge_mask(user_id: int) -> int:
+    """
+    Get user's earned badge bitmask
+
+    Args:
+        user_id: Telegram user ID
+
+    Returns:
+        Bitmask of earned badge ordinals (0 if none)
+    """
+    try:
+        conn = _connect()
+        row = conn.execute(
+            "SELECT badge_mask FROM user_badges WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+    except sqlite3.Error as e:
+        print(f"Database error in get_badge_mask: {e}")
+        return 0
+
+
+def get_badge_dates(user_id: int) -> Dict[str, str]:
+    """
+    Get earn dates of user's badges
+
+    Args:
+        user_id: Telegram user ID
+
+    Returns:
+        Dict of badge ID -> ISO earn date
+    """
+    try:
+        conn = _connect()
+        rows = conn.execute(
+            "SELECT badge_id, earned_at FROM badge_earned_at WHERE user_id = ?",
+            (user_id,)
+        ).fetchall()
+        return dict(rows)
+    except sqlite3.Error as e:
+        print(f"Database error in get_badge_dates: {e}")
+        return {}
+
+
+def award_badges(awards: Dict[int, Tuple[int, Dict[str, str]]]) -> bool:
+    """
+    Add badges for one or more users in a single transaction
+
+    Args:
+        awards: user_id -> (bits to set, {badge_id: ISO earn date})
+
+    Returns:
+        True if successful, False otherwise
+    """
+    if not awards:
+        return True
+
+    try:
+        conn = _connect()
+        with conn:
+            conn.executemany("""
+                INSERT INTO user_badges (user_id, badge_mask)
+                VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE
+                SET badge_mask = badge_mask | excluded.badge_mask
+            """, [(user_id, bits) for user_id, (bits, _) in awards.items()])
+
+            conn.executemany("""
+                INSERT OR IGNORE INTO badge_earned_at (user_id, badge_id, earned_at)
+                VALUES (?, ?, ?)
+            """, [
+                (user_id, badge_id, earned_at)
+                for user_id, (_, dates) in awards.items()
+                for badge_id, earned_at in dates.items()
+            ])
+        return True
+    except sqlite3.Error as e:
+        print(f"Database error in award_badges: {e}")
+        return False
+
+
+def iter_badge_masks() -> Iterator[Tuple[int, int]]:
+    """Stream (user_id, badge_mask) for every user with badges"""
+    try:
+        conn = _connect()
+        yield from conn.execute("SELECT user_id, badge_mask FROM user_badges")
+    except sqlite3.Error as e:
+        print(f"Database error in iter_badge_masks: {e}")
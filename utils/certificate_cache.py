@@ -0,0 +1,254 @@
+"""
+Content-addressed certificate cache
+Rendered certificates are stored on disk under a hash of everything drawn
+on them and of the encoder settings, with the extension of the format the
+encoder picked. Once Telegram has a copy, its file_id is remembered too,
+so repeat sends are a reference instead of an upload.
+
+The functions here do blocking file I/O and share module state; from the
+event loop call them through run_io(), which runs them one at a time on
+the cache's own thread.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from typing import Awaitable, Callable, Optional, Tuple, Union
+import asyncio
+import hashlib
+import json
+import os
+
+from telegram.error import BadRequest
+
+from settings import CERTIFICATE_BYTE_BUDGET, CERTIFICATE_ENCODER_LADDER
+
+CERTIFICATE_CACHE_DIR = 'certificate_cache'
+# Total size of cached images before least recently used ones are evicted
+CERTIFICATE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Extensions of the formats the encoder ladder can produce
+CERTIFICATE_EXTENSIONS = ('jpg', 'webp')
+
+FILE_IDS_FILE = 'file_ids.json'
+
+_entries = None   # OrderedDict key -> (size, extension), least recently used first
+_file_ids = {}    # key -> Telegram file_id
+_total_bytes = 0
+
+_io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='certificate-cache')
+
+
+async def run_io(func: Callable, *args, **kwargs):
+    """Run a cache function on the cache thread, e.g. run_io(get, key)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, partial(func, *args, **kwargs))
+
+
+def certificate_key(*parts) -> str:
+    """
+    Cache key for a certificate, e.g. (template, badge_id, username, date)
+
+    The encoder settings are part of every key, so changing them never
+    serves certificates encoded under the old ones.
+    """
+    encoder = (CERTIFICATE_BYTE_BUDGET, CERTIFICATE_ENCODER_LADDER)
+    raw = json.dumps((encoder, parts), ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _path(key: str, extension: str) -> str:
+    return os.path.join(CERTIFICATE_CACHE_DIR, f'{key}.{extension}')
+
+
+def _remove(key: str, extension: str) -> None:
+    try:
+        os.remove(_path(key, extension))
+    except OSError:
+        pass
+
+
+def _load() -> None:
+    """Scan cache directory once (oldest access first)"""
+    global _entries, _file_ids, _total_bytes
+
+    if _entries is not None:
+        return
+
+    _entries = OrderedDict()
+    _total_bytes = 0
+    os.makedirs(CERTIFICATE_CACHE_DIR, exist_ok=True)
+
+    files = []
+    for entry in os.scandir(CERTIFICATE_CACHE_DIR):
+        key, _, extension = entry.name.partition('.')
+        if extension in CERTIFICATE_EXTENSIONS:
+            stat = entry.stat()
+            files.append((stat.st_mtime, key, extension, stat.st_size))
+    for _, key, extension, size in sorted(files):
+        if key in _entries:
+            # Stored again in another format: keep the newer file
+            old_size, old_extension = _entries.pop(key)
+            _total_bytes -= old_size
+            _remove(key, old_extension)
+        _entries[key] = (size, extension)
+        _total_bytes += size
+
+    try:
+        with open(os.path.join(CERTIFICATE_CACHE_DIR, FILE_IDS_FILE), 'r', encoding='utf-8') as f:
+            _file_ids = json.load(f)
+    except FileNotFoundError:
+        _file_ids = {}
+    except Exception as e:
+        print(f"Error loading certificate file IDs: {e}")
+        _file_ids = {}
+
+
+def _save_file_ids() -> None:
+    path = os.path.join(CERTIFICATE_CACHE_DIR, FILE_IDS_FILE)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_file_ids, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error saving certificate file IDs: {e}")
+
+
+def _evict() -> None:
+    global _total_bytes
+
+    evicted = False
+    while _total_bytes > CERTIFICATE_CACHE_MAX_BYTES and _entries:
+        key, (size, extension) = _entries.popitem(last=False)
+        _total_bytes -= size
+        evicted |= _file_ids.pop(key, None) is not None
+        _remove(key, extension)
+
+    if evicted:
+        _save_file_ids()
+
+
+def has(key: str) -> bool:
+    """True if the certificate is cached"""
+    _load()
+    return key in _entries
+
+
+def get(key: str) -> Optional[Union[str, BytesIO]]:
+    """
+    Cached certificate
+
+    Returns:
+        Telegram file_id if the certificate was already uploaded, else the
+        image (named with its format's extension), or None on a miss
+    """
+    _load()
+
+    if key not in _entries:
+        return None
+
+    _entries.move_to_end(key)
+    _, extension = _entries[key]
+    file_id = _file_ids.get(key)
+    try:
+        os.utime(_path(key, extension))  # keep LRU order across restarts
+        if file_id:
+            return file_id
+        with open(_path(key, extension), 'rb') as f:
+            certificate = BytesIO(f.read())
+    except OSError:
+        forget(key)
+        return file_id
+
+    certificate.name = f'certificate.{extension}'
+    return certificate
+
+
+def put(key: str, certificate: BytesIO) -> None:
+    """Store a rendered certificate (its .name extension gives the format)"""
+    global _total_bytes
+
+    _load()
+
+    extension = os.path.splitext(getattr(certificate, 'name', ''))[1].lstrip('.').lower()
+    if extension not in CERTIFICATE_EXTENSIONS:
+        extension = 'jpg'
+    data = certificate.getvalue()
+
+    tmp_path = _path(key, extension) + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, _path(key, extension))
+    except OSError as e:
+        print(f"Error caching certificate: {e}")
+        return
+
+    old_size, old_extension = _entries.pop(key, (0, extension))
+    if old_extension != extension:
+        _remove(key, old_extension)
+    _total_bytes += len(data) - old_size
+    _entries[key] = (len(data), extension)
+    _evict()
+
+
+def set_file_id(key: str, file_id: str) -> None:
+    """Remember Telegram's file_id of an uploaded certificate"""
+    _load()
+
+    if key in _entries and _file_ids.get(key) != file_id:
+        _file_ids[key] = file_id
+        _save_file_ids()
+
+
+def drop_file_id(key: str) -> None:
+    """Forget Telegram's file_id but keep the image, e.g. when the file_id is rejected"""
+    _load()
+
+    if _file_ids.pop(key, None) is not None:
+        _save_file_ids()
+
+
+def forget(key: str) -> None:
+    """Drop a certificate and its file_id"""
+    global _total_bytes
+
+    _load()
+
+    size, extension = _entries.pop(key, (0, None))
+    _total_bytes -= size
+    if _file_ids.pop(key, None) is not None:
+        _save_file_ids()
+    if extension is not None:
+        _remove(key, extension)
+
+
+async def send_certificate(send: Callable[..., Awaitable], load: Callable[[], Awaitable[Tuple]]):
+    """
+    Send a certificate and remember Telegram's file_id of it
+
+    If Telegram rejects a cached file_id, the file_id is dropped and the
+    certificate is sent once more as an upload.
+
+    Args:
+        send: Coroutine function sending a photo (file_id or BytesIO)
+        load: Coroutine function returning (file_id or BytesIO, cache key)
+
+    Returns:
+        Whatever send returns
+    """
+    certificate, key = await load()
+    try:
+        sent = await send(certificate)
+    except BadRequest as e:
+        if not isinstance(certificate, str):
+            raise
+        print(f"Cached certificate file_id rejected, uploading again: {e}")
+        await run_io(drop_file_id, key)
+        certificate, key = await load()
+        sent = await send(certificate)
+
+    if sent is not None and sent.photo:
+        await run_io(set_file_id, key, sent.photo[-1].file_id)
+    return sent
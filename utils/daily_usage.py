@@ -0,0 +1,190 @@
+"""
+Daily test counters
+Tests taken per day are counted in memory, so daily limit checks cost no
+I/O. Changed counters are written to daily_usage in coalesced batches, and
+today's rows are loaded back at startup so a restart doesn't reset limits.
+
+These counters replaced the single-statement INSERT ... ON CONFLICT upsert
+that reserve_test_slot() used to run on the database thread. reserve()
+stays atomic because nothing awaits between the check and the increment.
+"""
+
+from datetime import date
+from typing import List, Optional, Tuple
+import asyncio
+import atexit
+import sqlite3
+
+from utils.db import get_connection, transaction, run_db
+
+# Seconds to coalesce counter changes before writing them
+DAILY_USAGE_FLUSH_INTERVAL = 10
+# Rows written per transaction
+DAILY_USAGE_FLUSH_BATCH = 500
+
+_day = None         # ISO date the counters belong to
+_counts = {}        # user_id -> tests taken on _day
+_dirty = {}         # (date, user_id) -> count not written yet
+_flush_handle = None
+
+
+def _roll_day() -> None:
+    """Start a new day's counters (loading stored ones on first use)"""
+    global _day, _counts
+
+    today = date.today().isoformat()
+    if today == _day:
+        return
+
+    # Unwritten counts of the previous day stay in _dirty under their date.
+    # After midnight nothing is stored for the new day yet, so only the
+    # first call after startup has to read the table.
+    first_load = _day is None
+    _day = today
+    _counts = {}
+    if not first_load:
+        return
+
+    try:
+        rows = get_connection().execute("""
+            SELECT user_id, tests_taken FROM daily_usage
+            WHERE date = ?
+        """, (today,)).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error loading daily usage: {e}")
+        return
+
+    for user_id, tests_taken in rows:
+        _counts[user_id] = tests_taken or 0
+
+
+def load_today() -> int:
+    """
+    Load today's counters from daily_usage (call once at startup)
+
+    Returns:
+        Number of users with tests today
+    """
+    _roll_day()
+    return len(_counts)
+
+
+def get_count(user_id: int) -> int:
+    """Tests the user has taken today"""
+    _roll_day()
+    return _counts.get(user_id, 0)
+
+
+def _set_count(user_id: int, count: int) -> None:
+    _counts[user_id] = count
+    _dirty[(_day, user_id)] = count
+    _schedule_flush()
+
+
+def increment(user_id: int) -> int:
+    """
+    Count a test without checking any limit
+
+    Returns:
+        Tests taken today including this one
+    """
+    count = get_count(user_id) + 1
+    _set_count(user_id, count)
+    return count
+
+
+def reserve(user_id: int, limit: int) -> Optional[int]:
+    """
+    Count a test if the user is still under the limit
+
+    Returns:
+        Tests taken today including this one, or None if the limit is reached
+    """
+    count = get_count(user_id)
+    if count >= limit:
+        return None
+
+    _set_count(user_id, count + 1)
+    return count + 1
+
+
+def _write(rows: List[Tuple[int, str, int]]) -> bool:
+    """Upsert (user_id, date, tests_taken) rows; counts never go down"""
+    try:
+        with transaction() as conn:
+            conn.executemany("""
+                INSERT INTO daily_usage (user_id, date, tests_taken)
+                VALUES (?, ?, ?)
+                ON CONFLICT(user_id, date) DO UPDATE
+                SET tests_taken = MAX(tests_taken, excluded.tests_taken)
+            """, rows)
+        return True
+    except sqlite3.Error as e:
+        print(f"Database error saving daily usage: {e}")
+        return False
+
+
+def _take_batches() -> List[List[Tuple[int, str, int]]]:
+    """Pending rows split into DAILY_USAGE_FLUSH_BATCH-sized batches"""
+    global _dirty
+
+    pending, _dirty = _dirty, {}
+    rows = [(user_id, day, count) for (day, user_id), count in pending.items()]
+    return [rows[i:i + DAILY_USAGE_FLUSH_BATCH]
+            for i in range(0, len(rows), DAILY_USAGE_FLUSH_BATCH)]
+
+
+def _restore(rows: List[Tuple[int, str, int]]) -> None:
+    """Put back rows that failed to write (unless counted further meanwhile)"""
+    for user_id, day, count in rows:
+        key = (day, user_id)
+        _dirty[key] = max(count, _dirty.get(key, 0))
+
+
+async def _flush_async() -> None:
+    for batch in _take_batches():
+        if not await run_db(_write, batch):
+            _restore(batch)
+
+    if _dirty:
+        _schedule_flush()
+
+
+def _start_flush() -> None:
+    global _flush_handle
+    _flush_handle = None
+    asyncio.get_running_loop().create_task(_flush_async())
+
+
+def flush_daily_usage() -> None:
+    """Write all pending counters now (blocking)"""
+    global _flush_handle
+
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+
+    for batch in _take_batches():
+        if not _write(batch):
+            _restore(batch)
+
+
+def _schedule_flush() -> None:
+    """Schedule a coalesced write of changed counters"""
+    global _flush_handle
+
+    if _flush_handle is not None:
+        return
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop (scripts): write immediately
+        flush_daily_usage()
+        return
+
+    _flush_handle = loop.call_later(DAILY_USAGE_FLUSH_INTERVAL, _start_flush)
+
+
+# Don't lose the last batch on shutdown
+atexit.register(flush_daily_usage)
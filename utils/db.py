@@ -0,0 +1,103 @@
+"""
+SQLite connection manager
+Each thread opens one connection to the bot database on first use and
+keeps it, instead of connecting and closing around every query.
+
+Async code runs its queries on a dedicated database thread via run_db(),
+so slow disk I/O or lock waits never block the event loop.
+
+Path, journal mode and cache/mmap sizes come from settings.py.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Iterator
+import asyncio
+import atexit
+import sqlite3
+import threading
+
+from settings import DB_PATH, DB_JOURNAL_MODE, DB_CACHE_SIZE, DB_MMAP_SIZE
+
+# Seconds to wait for a lock held by another connection before failing
+DB_BUSY_TIMEOUT = 5.0
+# Prepared statements kept per connection
+DB_CACHED_STATEMENTS = 256
+
+_local = threading.local()
+
+# Single database thread: SQLite serializes writers anyway, and one thread
+# means one long-lived connection and no lock contention between our own queries
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+
+
+def _open() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT,
+        cached_statements=DB_CACHED_STATEMENTS
+    )
+    conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+    if DB_JOURNAL_MODE == 'WAL':
+        # With WAL, synchronous=NORMAL is still safe against corruption
+        conn.execute("PRAGMA synchronous=NORMAL")
+    # Negative cache_size is in KiB rather than pages
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE}")
+    # Reads of mapped pages come straight from the OS page cache, without a read() copy
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """This thread's database connection (opened on first use)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _open()
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Connection whose changes are committed on success and rolled back on error"""
+    conn = get_connection()
+    with conn:
+        yield conn
+
+
+async def run_db(func: Callable, *args, **kwargs):
+    """
+    Run a blocking database function on the database thread
+
+    Args:
+        func: Function doing the queries (uses get_connection()/transaction())
+
+    Returns:
+        Whatever func returns
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, partial(func, *args, **kwargs))
+
+
+def close_connection() -> None:
+    """Close this thread's connection (SQLite connections can't be closed from other threads)"""
+    conn = _local.__dict__.pop('conn', None)
+    if conn is not None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def shutdown() -> None:
+    """Finish queued database work and close connections"""
+    try:
+        _db_executor.submit(close_connection)
+    except RuntimeError:
+        pass  # already shut down
+    _db_executor.shutdown(wait=True)
+    close_connection()
+
+
+atexit.register(shutdown)
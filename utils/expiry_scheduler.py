@@ -0,0 +1,246 @@
+"""
+Subscription expiry scheduler
+Keeps a min-heap of upcoming subscription ends, flips subscriptions to
+'expired' in batches as their end passes and drops them from the premium
+cache. Optionally reminds users shortly before their subscription ends.
+"""
+
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+import asyncio
+import heapq
+import sqlite3
+import threading
+
+from utils.db import get_connection, transaction, run_db
+
+# Remind users this long before their subscription ends (None disables reminders)
+EXPIRY_REMINDER_BEFORE = timedelta(days=3)
+# Reminder messages sent per second at most
+EXPIRY_REMINDER_RATE = 20
+# Subscriptions expired per transaction
+EXPIRY_BATCH_SIZE = 500
+# Longest sleep between checks, so clock changes are noticed
+EXPIRY_MAX_SLEEP = 3600
+# Seconds before a batch that failed to expire is tried again
+EXPIRY_RETRY_DELAY = 60
+
+EXPIRE = 'expire'
+REMIND = 'remind'
+
+_heap = []          # (when, event, user_id, end_date ISO string)
+_scheduled = {}     # user_id -> end_date ISO string of the current subscription
+_lock = threading.Lock()   # subscriptions are saved on the database thread
+
+_task = None
+_wakeup = None
+_loop = None
+
+
+def _push(user_id: int, end_date: str, now: datetime) -> None:
+    """Add heap events for a subscription (caller holds _lock)"""
+    try:
+        end = datetime.fromisoformat(end_date)
+    except (ValueError, TypeError):
+        return
+
+    _scheduled[user_id] = end_date
+    heapq.heappush(_heap, (end, EXPIRE, user_id, end_date))
+
+    if EXPIRY_REMINDER_BEFORE is not None:
+        remind_at = end - EXPIRY_REMINDER_BEFORE
+        # Reminders already due are skipped rather than repeated after restarts
+        if remind_at > now:
+            heapq.heappush(_heap, (remind_at, REMIND, user_id, end_date))
+
+
+def schedule(user_id: int, end_date: datetime) -> None:
+    """
+    Schedule expiry of a newly saved subscription (any thread)
+
+    Events of the user's previous subscription become stale and are skipped.
+    """
+    with _lock:
+        _push(user_id, end_date.isoformat(), datetime.now())
+
+    # Wake the scheduler in case this one ends before everything else
+    if _loop is not None and _wakeup is not None:
+        try:
+            _loop.call_soon_threadsafe(_wakeup.set)
+        except RuntimeError:
+            pass  # event loop already closed
+
+
+def unschedule(user_id: int) -> None:
+    """Forget a cancelled subscription (its heap events become stale)"""
+    with _lock:
+        _scheduled.pop(user_id, None)
+
+
+def load_pending() -> int:
+    """
+    Schedule every active subscription (call once at startup)
+
+    Returns:
+        Number of subscriptions scheduled
+    """
+    try:
+        rows = get_connection().execute("""
+            SELECT user_id, end_date FROM subscriptions
+            WHERE status = 'active' AND end_date IS NOT NULL
+        """).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error loading subscriptions: {e}")
+        return 0
+
+    now = datetime.now()
+    with _lock:
+        for user_id, end_date in rows:
+            _push(user_id, end_date, now)
+        return len(_scheduled)
+
+
+def _pop_due(now: datetime) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+    """Due (user_id, end_date) expiries and reminders, skipping stale events"""
+    expiries = []
+    reminders = []
+
+    with _lock:
+        while _heap and _heap[0][0] <= now:
+            _, event, user_id, end_date = heapq.heappop(_heap)
+            if _scheduled.get(user_id) != end_date:
+                continue  # renewed or replaced since
+            if event == EXPIRE:
+                del _scheduled[user_id]
+                expiries.append((user_id, end_date))
+            else:
+                reminders.append((user_id, end_date))
+
+    return expiries, reminders
+
+
+def _restore(batch: List[Tuple[int, str]], retry_at: datetime) -> None:
+    """Reschedule expiries that failed to commit (unless renewed meanwhile)"""
+    with _lock:
+        for user_id, end_date in batch:
+            if user_id in _scheduled:
+                continue  # saved again since, the new events take over
+            _scheduled[user_id] = end_date
+            heapq.heappush(_heap, (retry_at, EXPIRE, user_id, end_date))
+
+
+def _seconds_until_next(now: datetime) -> float:
+    with _lock:
+        if not _heap:
+            return EXPIRY_MAX_SLEEP
+        return min(EXPIRY_MAX_SLEEP, max(0.0, (_heap[0][0] - now).total_seconds()))
+
+
+def _expire(batch: List[Tuple[int, str]]) -> Optional[List[int]]:
+    """
+    Mark subscriptions expired (runs on the database thread)
+
+    Rows whose end_date changed since they were scheduled are left alone.
+
+    Returns:
+        Users whose subscription was expired, or None if the batch failed
+    """
+    from utils.premium import invalidate_premium_cache
+
+    expired = []
+    try:
+        with transaction() as conn:
+            for user_id, end_date in batch:
+                cursor = conn.execute("""
+                    UPDATE subscriptions
+                    SET status = 'expired', updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = ? AND status = 'active' AND end_date = ?
+                """, (user_id, end_date))
+                if cursor.rowcount:
+                    expired.append(user_id)
+    except sqlite3.Error as e:
+        print(f"Database error expiring subscriptions: {e}")
+        return None
+
+    for user_id in expired:
+        invalidate_premium_cache(user_id)
+    return expired
+
+
+async def _send_reminders(bot, reminders: List[Tuple[int, str]]) -> None:
+    for user_id, end_date in reminders:
+        try:
+            await bot.send_message(
+                chat_id=user_id,
+                text=(
+                    "⏳ <b>Your Premium subscription ends soon</b>\n\n"
+                    f"📆 Expires: {datetime.fromisoformat(end_date).strftime('%Y-%m-%d')}\n\n"
+                    "Renew with /premium to keep unlimited tests and explanations."
+                ),
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            print(f"Error sending renewal reminder to {user_id}: {e}")
+        await asyncio.sleep(1 / EXPIRY_REMINDER_RATE)
+
+
+async def run_expiry_scheduler(bot=None) -> None:
+    """
+    Expire subscriptions as they end (runs until cancelled)
+
+    Args:
+        bot: Bot used for renewal reminders (None disables them)
+    """
+    global _wakeup, _loop
+
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+
+    await run_db(load_pending)
+
+    while True:
+        try:
+            expiries, reminders = _pop_due(datetime.now())
+
+            for start in range(0, len(expiries), EXPIRY_BATCH_SIZE):
+                batch = expiries[start:start + EXPIRY_BATCH_SIZE]
+                expired = await run_db(_expire, batch)
+                if expired is None:
+                    _restore(batch, datetime.now() + timedelta(seconds=EXPIRY_RETRY_DELAY))
+                elif expired:
+                    print(f"Expired {len(expired)} premium subscription(s)")
+
+            if reminders and bot is not None:
+                await _send_reminders(bot, reminders)
+
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), _seconds_until_next(datetime.now()))
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Expiry scheduler error: {e}")
+            await asyncio.sleep(EXPIRY_MAX_SLEEP / 60)
+
+
+def start(bot=None) -> None:
+    """Start the scheduler task on the running event loop"""
+    global _task
+
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(run_expiry_scheduler(bot))
+
+
+async def stop() -> None:
+    """Cancel the scheduler task"""
+    global _task
+
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
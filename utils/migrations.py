@@ -0,0 +1,99 @@
+"""
+Database schema migrations
+Migrations are numbered SQL files in migrations/ (0001_name.sql, ...).
+The database's PRAGMA user_version holds the number of the last one
+applied; pending ones are applied in order, each in its own transaction.
+"""
+
+from typing import List, Optional, Tuple
+import os
+import re
+import sqlite3
+
+from utils.db import get_connection
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+_MIGRATION_FILE = re.compile(r'^(\d+)_\w+\.sql$')
+
+
+def get_migrations() -> List[Tuple[int, str]]:
+    """(version, path) of every migration file, in order"""
+    migrations = []
+    for name in os.listdir(MIGRATIONS_DIR):
+        match = _MIGRATION_FILE.match(name)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(MIGRATIONS_DIR, name)))
+    return sorted(migrations)
+
+
+def get_schema_version(conn: Optional[sqlite3.Connection] = None) -> int:
+    """Number of the last migration applied to the database"""
+    conn = conn or get_connection()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _statements(sql: str) -> List[str]:
+    """Split a migration script into single statements"""
+    statements = []
+    pending = ''
+    for line in sql.splitlines(keepends=True):
+        pending += line
+        if sqlite3.complete_statement(pending):
+            statements.append(pending.strip())
+            pending = ''
+
+    leftover = [l for l in pending.splitlines() if l.strip() and not l.strip().startswith('--')]
+    if leftover:
+        raise sqlite3.OperationalError(f"Incomplete statement in migration: {leftover[0][:60]}")
+    return statements
+
+
+def _apply(conn: sqlite3.Connection, version: int, path: str) -> bool:
+    """Apply one migration unless another process already did (True if applied)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        statements = _statements(f.read())
+
+    # Statements run one by one (executescript() would commit midway).
+    # BEGIN IMMEDIATE takes the write lock before the version is re-checked,
+    # so two processes starting together can't both apply a migration.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if get_schema_version(conn) >= version:
+            conn.rollback()
+            return False
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {version}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def migrate(conn: Optional[sqlite3.Connection] = None) -> List[int]:
+    """
+    Apply pending migrations
+
+    Args:
+        conn: Connection to migrate (this thread's connection by default)
+
+    Returns:
+        Versions applied, in order
+
+    Raises:
+        sqlite3.Error: If a migration fails (it is rolled back entirely)
+    """
+    conn = conn or get_connection()
+    current = get_schema_version(conn)
+
+    applied = []
+    for version, path in get_migrations():
+        if version <= current:
+            continue
+        if _apply(conn, version, path):
+            applied.append(version)
+            print(f"Applied migration {os.path.basename(path)}")
+
+    return applied
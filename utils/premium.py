@@ -3,38 +3,13 @@ Premium subscription management for PPD Bot
 Handles premium tier checks, limits, and feature access
 """
 
-from datetime import datetime, date, timedelta
-from typing import Optional, Dict
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Tuple
 import sqlite3
-import os
+import time
 
-# Auto-detect database path
-def get_db_path():
-    """Find the database file in your project"""
-    # Try to import from config first
-    try:
-        from config import DB_PATH
-        return DB_PATH
-    except (ImportError, AttributeError):
-        pass
-    
-    # Try common paths
-    possible_paths = [
-        'ppd_bot.db',
-        'bot.db',
-        'database.db',
-        'data/ppd_bot.db',
-        'data/bot.db',
-    ]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            return path
-    
-    # Default
-    return 'ppd_bot.db'
-
-DB_PATH = get_db_path()
+from utils.db import get_connection, transaction, run_db
+from utils import daily_usage, expiry_scheduler
 
 class PremiumTier:
     """Subscription tier constants"""
@@ -48,6 +23,55 @@ class PremiumLimits:
     PREMIUM_DAILY_TESTS = -1  # Unlimited
     PREMIUM_HISTORY_LIMIT = -1  # Unlimited
 
+# Seconds a cached premium status is trusted before re-reading it, so changes
+# made outside this process (admin scripts, manual edits) are picked up.
+# Active subscriptions still stop counting as premium exactly at end_date.
+PREMIUM_CACHE_TTL = 600
+# Seconds a failed read is remembered as "not premium", so a broken or
+# locked database isn't queried again on every check
+PREMIUM_CACHE_ERROR_TTL = 5
+
+# user_id -> (plan_type, end_date, status, expires_at). Filled and invalidated
+# on the database thread, so a write can't be overtaken by a stale read.
+_premium_cache: Dict[int, Tuple[Optional[str], Optional[datetime], Optional[str], float]] = {}
+
+
+def _cache_subscription(user_id: int, sub: Optional[Dict]) -> None:
+    """Remember a subscription row (or its absence) for is_premium"""
+    expires_at = time.monotonic() + PREMIUM_CACHE_TTL
+    if not sub:
+        _premium_cache[user_id] = (None, None, None, expires_at)
+        return
+
+    try:
+        end_date = datetime.fromisoformat(sub['end_date'])
+    except (ValueError, TypeError):
+        end_date = None
+    _premium_cache[user_id] = (sub['plan_type'], end_date, sub['status'], expires_at)
+
+
+def _cached_is_premium(user_id: int) -> Optional[bool]:
+    """Premium status from the cache, or None if it has to be read"""
+    entry = _premium_cache.get(user_id)
+    if entry is None:
+        return None
+
+    plan_type, end_date, status, expires_at = entry
+    if time.monotonic() > expires_at:
+        return None
+
+    # Free tier
+    if plan_type is None or plan_type == PremiumTier.FREE:
+        return False
+
+    # Active and not expired
+    return status == 'active' and end_date is not None and end_date > datetime.now()
+
+
+def invalidate_premium_cache(user_id: int) -> None:
+    """Forget a user's cached premium status"""
+    _premium_cache.pop(user_id, None)
+
 class SubscriptionManager:
     """Manage premium subscriptions and feature access"""
     
@@ -63,9 +87,8 @@ class SubscriptionManager:
             Subscription dict or None if not found
         """
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+            cursor = get_connection().cursor()
+            cursor.row_factory = sqlite3.Row
             
             cursor.execute("""
                 SELECT * FROM subscriptions 
@@ -73,14 +96,14 @@ class SubscriptionManager:
             """, (user_id,))
             
             row = cursor.fetchone()
-            conn.close()
+            sub = dict(row) if row else None
+            _cache_subscription(user_id, sub)
             
-            if row:
-                return dict(row)
-            return None
+            return sub
             
         except sqlite3.Error as e:
             print(f"Database error in get_user_subscription: {e}")
+            _premium_cache[user_id] = (None, None, None, time.monotonic() + PREMIUM_CACHE_ERROR_TTL)
             return None
     
     @staticmethod
@@ -94,30 +117,21 @@ class SubscriptionManager:
         Returns:
             True if premium, False otherwise
         """
-        sub = SubscriptionManager.get_user_subscription(user_id)
+        premium = _cached_is_premium(user_id)
+        if premium is None:
+            await run_db(SubscriptionManager.get_user_subscription, user_id)
+            premium = _cached_is_premium(user_id)
+        if premium is None:
+            # A save/cancel invalidated the entry in the meantime: read once more
+            await run_db(SubscriptionManager.get_user_subscription, user_id)
+            premium = _cached_is_premium(user_id)
         
-        if not sub:
-            return False
-        
-        # Free tier
-        if sub['plan_type'] == PremiumTier.FREE:
-            return False
-        
-        # Check if subscription is active and not expired
-        if sub['status'] == 'active':
-            try:
-                end_date = datetime.fromisoformat(sub['end_date'])
-                if end_date > datetime.now():
-                    return True
-            except (ValueError, TypeError):
-                return False
-        
-        return False
+        return bool(premium)
     
     @staticmethod
     def get_today_test_count(user_id: int) -> int:
         """
-        Get number of tests taken today
+        Get number of tests taken today (in-memory counter, no I/O)
         
         Args:
             user_id: Telegram user ID
@@ -125,30 +139,13 @@ class SubscriptionManager:
         Returns:
             Test count for today
         """
-        try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            today = date.today().isoformat()
-            
-            cursor.execute("""
-                SELECT tests_taken FROM daily_usage 
-                WHERE user_id = ? AND date = ?
-            """, (user_id, today))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            return result[0] if result else 0
-            
-        except sqlite3.Error as e:
-            print(f"Database error in get_today_test_count: {e}")
-            return 0
+        return daily_usage.get_count(user_id)
     
     @staticmethod
     def increment_daily_usage(user_id: int) -> bool:
         """
         Increment daily test usage counter
+        Written to daily_usage in the next batch
         
         Args:
             user_id: Telegram user ID
@@ -156,33 +153,8 @@ class SubscriptionManager:
         Returns:
             True if successful, False otherwise
         """
-        try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            today = date.today().isoformat()
-            
-            # Try to increment existing record
-            cursor.execute("""
-                UPDATE daily_usage 
-                SET tests_taken = tests_taken + 1 
-                WHERE user_id = ? AND date = ?
-            """, (user_id, today))
-            
-            # If no record exists, create one
-            if cursor.rowcount == 0:
-                cursor.execute("""
-                    INSERT INTO daily_usage (user_id, date, tests_taken) 
-                    VALUES (?, ?, 1)
-                """, (user_id, today))
-            
-            conn.commit()
-            conn.close()
-            return True
-            
-        except sqlite3.Error as e:
-            print(f"Database error in increment_daily_usage: {e}")
-            return False
+        daily_usage.increment(user_id)
+        return True
     
     @staticmethod
     async def check_daily_limit(user_id: int) -> Dict[str, any]:
@@ -207,7 +179,7 @@ class SubscriptionManager:
             }
         
         # Free users: limited tests per day
-        today_count = SubscriptionManager.get_today_test_count(user_id)
+        today_count = daily_usage.get_count(user_id)
         limit = PremiumLimits.FREE_DAILY_TESTS
         remaining = max(0, limit - today_count)
         
@@ -219,6 +191,40 @@ class SubscriptionManager:
             'is_premium': False
         }
     
+    @staticmethod
+    async def reserve_test_slot(user_id: int) -> Dict[str, any]:
+        """
+        Check the daily limit and count a new test in one step
+        
+        Safe under concurrent taps: the check and the increment happen with
+        no await in between, so a free user can never get past the limit.
+        
+        Args:
+            user_id: Telegram user ID
+            
+        Returns:
+            Dict like check_daily_limit(); 'count' includes this test if allowed
+        """
+        if await SubscriptionManager.is_premium(user_id):
+            return {
+                'allowed': True,
+                'remaining': 'unlimited',
+                'limit': 'unlimited',
+                'count': 0,
+                'is_premium': True
+            }
+        
+        limit = PremiumLimits.FREE_DAILY_TESTS
+        count = daily_usage.reserve(user_id, limit)
+        
+        return {
+            'allowed': count is not None,
+            'remaining': max(0, limit - (count or limit)),
+            'limit': limit,
+            'count': count or limit,
+            'is_premium': False
+        }
+    
     @staticmethod
     async def can_view_explanations(user_id: int) -> bool:
         """
@@ -287,23 +293,23 @@ class SubscriptionManager:
             True if successful, False otherwise
         """
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT OR REPLACE INTO subscriptions 
-                (user_id, plan_type, start_date, end_date, payment_id, status)
-                VALUES (?, ?, ?, ?, ?, 'active')
-            """, (
-                user_id,
-                plan_type,
-                start_date.isoformat(),
-                end_date.isoformat(),
-                payment_id
-            ))
-            
-            conn.commit()
-            conn.close()
+            with transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("""
+                    INSERT OR REPLACE INTO subscriptions 
+                    (user_id, plan_type, start_date, end_date, payment_id, status)
+                    VALUES (?, ?, ?, ?, ?, 'active')
+                """, (
+                    user_id,
+                    plan_type,
+                    start_date.isoformat(),
+                    end_date.isoformat(),
+                    payment_id
+                ))
+            
+            invalidate_premium_cache(user_id)
+            expiry_scheduler.schedule(user_id, end_date)
             return True
             
         except sqlite3.Error as e:
@@ -334,30 +340,127 @@ class SubscriptionManager:
             True if successful, False otherwise
         """
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO payments 
-                (payment_id, user_id, amount, currency, plan_type, payment_provider, status)
-                VALUES (?, ?, ?, ?, ?, ?, 'completed')
-            """, (
-                payment_id,
-                user_id,
-                amount,
-                currency,
-                plan_type,
-                payment_provider
-            ))
+            with transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("""
+                    INSERT INTO payments 
+                    (payment_id, user_id, amount, currency, plan_type, payment_provider, status)
+                    VALUES (?, ?, ?, ?, ?, ?, 'completed')
+                """, (
+                    payment_id,
+                    user_id,
+                    amount,
+                    currency,
+                    plan_type,
+                    payment_provider
+                ))
             
-            conn.commit()
-            conn.close()
             return True
             
         except sqlite3.Error as e:
             print(f"Database error in save_payment: {e}")
             return False
     
+    @staticmethod
+    def process_payment(
+        payment_id: str,
+        user_id: int,
+        amount: float,
+        currency: str,
+        plan_type: str,
+        duration_days: int,
+        payment_provider: str
+    ) -> Optional[Dict]:
+        """
+        Record a payment and extend the user's subscription in one transaction
+        Idempotent on payment_id: a repeated delivery of the same charge
+        changes nothing
+        
+        Args:
+            payment_id: Payment transaction ID (e.g. telegram_payment_charge_id)
+            user_id: Telegram user ID
+            amount: Payment amount
+            currency: Currency code
+            plan_type: Plan type (monthly/yearly)
+            duration_days: Days of premium the payment buys
+            payment_provider: Payment provider name
+            
+        Returns:
+            Dict with 'end_date' and 'duplicate', or None on error
+        """
+        try:
+            with transaction() as conn:
+                cursor = conn.cursor()
+                
+                # Taking the write lock here keeps the read below consistent
+                cursor.execute("""
+                    INSERT INTO payments 
+                    (payment_id, user_id, amount, currency, plan_type, payment_provider, status)
+                    VALUES (?, ?, ?, ?, ?, ?, 'completed')
+                    ON CONFLICT(payment_id) DO NOTHING
+                """, (
+                    payment_id,
+                    user_id,
+                    amount,
+                    currency,
+                    plan_type,
+                    payment_provider
+                ))
+                duplicate = cursor.rowcount == 0
+                
+                cursor.execute("""
+                    SELECT plan_type, start_date, end_date, status FROM subscriptions 
+                    WHERE user_id = ?
+                """, (user_id,))
+                row = cursor.fetchone()
+                
+                current_end = None
+                if row and row[0] != PremiumTier.FREE and row[3] == 'active':
+                    try:
+                        current_end = datetime.fromisoformat(row[2])
+                    except (ValueError, TypeError):
+                        current_end = None
+                
+                if duplicate:
+                    return {'end_date': current_end, 'duplicate': True}
+                
+                # Paying early extends the running subscription
+                now = datetime.now()
+                if current_end is not None and current_end > now:
+                    start_date = row[1] or now.isoformat()
+                    end_date = current_end + timedelta(days=duration_days)
+                else:
+                    start_date = now.isoformat()
+                    end_date = now + timedelta(days=duration_days)
+                
+                cursor.execute("""
+                    INSERT INTO subscriptions 
+                    (user_id, plan_type, start_date, end_date, payment_id, status)
+                    VALUES (?, ?, ?, ?, ?, 'active')
+                    ON CONFLICT(user_id) DO UPDATE SET 
+                        plan_type = excluded.plan_type,
+                        start_date = excluded.start_date,
+                        end_date = excluded.end_date,
+                        payment_id = excluded.payment_id,
+                        status = 'active',
+                        updated_at = CURRENT_TIMESTAMP
+                """, (
+                    user_id,
+                    PremiumTier.PREMIUM,
+                    start_date,
+                    end_date.isoformat(),
+                    payment_id
+                ))
+            
+            invalidate_premium_cache(user_id)
+            expiry_scheduler.schedule(user_id, end_date)
+            return {'end_date': end_date, 'duplicate': False}
+            
+        except sqlite3.Error as e:
+            print(f"Database error in process_payment: {e}")
+            return None
+    
     @staticmethod
     def cancel_subscription(user_id: int) -> bool:
         """
@@ -370,17 +473,17 @@ class SubscriptionManager:
             True if successful, False otherwise
         """
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE subscriptions 
-                SET status = 'cancelled'
-                WHERE user_id = ?
-            """, (user_id,))
+            with transaction() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("""
+                    UPDATE subscriptions 
+                    SET status = 'cancelled'
+                    WHERE user_id = ?
+                """, (user_id,))
             
-            conn.commit()
-            conn.close()
+            invalidate_premium_cache(user_id)
+            expiry_scheduler.unschedule(user_id)
             return True
             
         except sqlite3.Error as e:
@@ -0,0 +1,100 @@
+"""
+Streaming points sketch for approximate leaderboard percentiles
+"""
+
+import math
+from typing import List
+
+
+class PointsSketch:
+    """
+    Log-bucketed histogram of leaderboard points
+
+    Each bucket covers a relative width of `accuracy`, so rank estimates
+    stay within a few percent no matter how many users are tracked.
+    Unlike t-digest/KLL it supports removal, which we need because a
+    user's points change on every test.
+
+    Bucket counts are mirrored in a Fenwick tree, so count_above() costs
+    O(log buckets) rather than summing every higher bucket.
+    """
+
+    def __init__(self, accuracy: float = 0.02):
+        self._base = math.log1p(accuracy)
+        self._counts: List[int] = [0]  # bucket 0 holds zero points
+        self._tree: List[int] = [0, 0]  # Fenwick tree over _counts, 1-based
+        self.total = 0
+
+    def _bucket(self, points: float) -> int:
+        if points < 1:
+            return 0
+        return int(math.log(points) / self._base) + 1
+
+    def _bounds(self, bucket: int):
+        if bucket == 0:
+            return 0.0, 1.0
+        return math.exp((bucket - 1) * self._base), math.exp(bucket * self._base)
+
+    def _grow(self, bucket: int) -> None:
+        """Make room for bucket (capacity doubles, tree rebuilt in O(buckets))"""
+        size = max(bucket + 1, 2 * len(self._counts))
+        self._counts.extend([0] * (size - len(self._counts)))
+
+        tree = [0] + self._counts
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _update(self, bucket: int, delta: int) -> None:
+        self._counts[bucket] += delta
+        i = bucket + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_upto(self, bucket: int) -> int:
+        """Users in buckets 0..bucket"""
+        count = 0
+        i = bucket + 1
+        while i > 0:
+            count += self._tree[i]
+            i -= i & -i
+        return count
+
+    def add(self, points: float) -> None:
+        """Add a user's points"""
+        bucket = self._bucket(points)
+        if bucket >= len(self._counts):
+            self._grow(bucket)
+        self._update(bucket, 1)
+        self.total += 1
+
+    def remove(self, points: float) -> None:
+        """Remove previously added points"""
+        bucket = self._bucket(points)
+        if bucket < len(self._counts) and self._counts[bucket] > 0:
+            self._update(bucket, -1)
+            self.total -= 1
+
+    def count_above(self, points: float) -> int:
+        """Estimated number of users with more points"""
+        bucket = self._bucket(points)
+        if bucket >= len(self._counts):
+            return 0
+
+        above = self.total - self._count_upto(bucket)
+
+        # Assume users are spread evenly inside the bucket
+        low, high = self._bounds(bucket)
+        share = (high - points) / (high - low) if high > low else 0.0
+        above += int(self._counts[bucket] * min(1.0, max(0.0, share)))
+
+        return above
+
+    def clear(self) -> None:
+        """Drop all points (period reset)"""
+        self._counts = [0]
+        self._tree = [0, 0]
+        self.total = 0
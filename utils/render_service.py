@@ -0,0 +1,83 @@
+"""
+Certificate rendering service
+Runs Pillow rendering jobs on a small thread pool so they never block the
+event loop. Pillow releases the GIL while decoding, compositing and
+encoding, so threads render in parallel without pickling images between
+processes.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable
+
+# Worker threads rendering certificates
+RENDER_WORKERS = 2
+# Jobs allowed to be queued or running at once - callers beyond this wait
+RENDER_QUEUE_LIMIT = 16
+# Seconds a caller waits for a queue slot, and then for the render itself
+RENDER_TIMEOUT = 20
+
+_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix='render')
+_slots = None
+
+
+class RenderBusy(Exception):
+    """Render queue stayed full for the whole timeout"""
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(RENDER_QUEUE_LIMIT)
+    return _slots
+
+
+def _release_slot(loop: asyncio.AbstractEventLoop, slots: asyncio.Semaphore) -> None:
+    try:
+        loop.call_soon_threadsafe(slots.release)
+    except RuntimeError:
+        pass  # event loop already closed
+
+
+async def render(func: Callable, *args, wait: bool = True, timeout: float = RENDER_TIMEOUT, **kwargs):
+    """
+    Run a rendering function on the render pool
+
+    Args:
+        func: Renderer, e.g. generate_badge_certificate
+        wait: If False, fail immediately when the queue is full
+        timeout: Seconds to wait for a slot and then for the result
+
+    Returns:
+        Whatever func returns
+
+    Raises:
+        RenderBusy: If no queue slot became free in time
+        asyncio.TimeoutError: If the render itself took too long
+    """
+    slots = _get_slots()
+    if not wait and slots.locked():
+        raise RenderBusy("Render queue is full")
+
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout)
+    except asyncio.TimeoutError:
+        raise RenderBusy("Render queue is full")
+
+    loop = asyncio.get_running_loop()
+    try:
+        job = _pool.submit(partial(func, *args, **kwargs))
+    except Exception:
+        slots.release()
+        raise
+
+    # Keep the slot until the thread is really done, even if the caller gave up
+    job.add_done_callback(lambda _: _release_slot(loop, slots))
+
+    return await asyncio.wait_for(asyncio.wrap_future(job), timeout)
+
+
+def shutdown() -> None:
+    """Stop accepting jobs and wait for running ones"""
+    _pool.shutdown(wait=True)